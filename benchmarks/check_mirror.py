@@ -0,0 +1,153 @@
+"""
+Check the fetch layer of eia_mirror against a local HTTP server standing in
+for the EIA website, in the style of python -m http.server. Covers a first
+download, 304 Not Modified, a re-download after the file changes, a missing
+file (404), and resuming a partial download with Range / If-Range:
+
+    python benchmarks/check_mirror.py
+
+Runs entirely offline. Exits with status 1 if any check fails.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from eia import eia_mirror
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Serves server.files ({path: bytes}) with an ETag, and honors
+    # If-None-Match and Range / If-Range the way the EIA website does.
+    # Every request is logged to server.requests.
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        etag = '"' + hashlib.md5(content).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        start = 0
+        status = 200
+        byte_range = self.headers.get("Range")
+        if byte_range and self.headers.get("If-Range") in (None, etag):
+            start = int(byte_range.split("=")[1].split("-")[0])
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */" +
+                                 str(len(content)))
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(content) - start))
+        if status == 206:
+            self.send_header("Content-Range", "bytes " + str(start) + "-" +
+                             str(len(content) - 1) + "/" + str(len(content)))
+        self.end_headers()
+        self.wfile.write(content[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.files = dict()
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def read_file(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+def run_checks(server, mirror_dir):
+    # Returns a list of (check, passed)
+    checks = []
+    base_url = "http://127.0.0.1:" + str(server.server_address[1])
+    file_path = "/electricity/data/eia860m/xls/january_generator2024.xlsx"
+    url = base_url + file_path
+    path = eia_mirror.get_mirror_path(url, mirror_dir)
+    server.files[file_path] = b"first version " * 1000
+    session = eia_mirror.get_session(retries=0)
+
+    status = eia_mirror.fetch_file(url, path, session=session)
+    checks.append(("first download", status == "downloaded" and
+                   read_file(path) == b"first version " * 1000))
+
+    status = eia_mirror.fetch_file(url, path, session=session)
+    checks.append(("unchanged file is not modified (304)",
+                   status == "not_modified" and
+                   "If-None-Match" in server.requests[-1][1]))
+
+    server.files[file_path] = b"second version " * 1000
+    status = eia_mirror.fetch_file(url, path, session=session)
+    checks.append(("changed file is downloaded again",
+                   status == "downloaded" and
+                   read_file(path) == b"second version " * 1000))
+
+    # Interrupt a download of the current version part way through
+    os.remove(path)
+    with open(path + ".part", 'wb') as file:
+        file.write((b"second version " * 1000)[:5000])
+    status = eia_mirror.fetch_file(url, path, session=session)
+    checks.append(("partial download is resumed (206)",
+                   status == "resumed" and
+                   read_file(path) == b"second version " * 1000 and
+                   server.requests[-1][1].get("Range") == "bytes=5000-"))
+
+    # A partial download of an older version is started over (If-Range)
+    os.remove(path)
+    with open(path + ".part", 'wb') as file:
+        file.write((b"second version " * 1000)[:5000])
+    server.files[file_path] = b"third version " * 1000
+    status = eia_mirror.fetch_file(url, path, session=session)
+    checks.append(("partial download of a changed file starts over",
+                   status == "downloaded" and
+                   read_file(path) == b"third version " * 1000))
+
+    # A partial file at least as long as the file can't be resumed (416)
+    os.remove(path)
+    with open(path + ".part", 'wb') as file:
+        file.write(b"x" * 20000)
+    status = eia_mirror.fetch_file(url, path, session=session)
+    checks.append(("unresumable partial download starts over (416)",
+                   status == "downloaded" and
+                   read_file(path) == b"third version " * 1000))
+
+    missing_url = base_url + "/electricity/data/eia860m/xls/missing.xlsx"
+    results = eia_mirror.mirror_files([url, missing_url], mirror_dir,
+                                      workers=2, session=session)
+    checks.append(("missing file (404) fails without stopping the mirror",
+                   results[missing_url][1] is None and
+                   results[url][1] == "not_modified" and
+                   not os.path.exists(eia_mirror.get_mirror_path(
+                       missing_url, mirror_dir))))
+    return checks
+
+
+if __name__ == "__main__":
+    server = start_server()
+    try:
+        with tempfile.TemporaryDirectory() as mirror_dir:
+            checks = run_checks(server, mirror_dir)
+    finally:
+        server.shutdown()
+    for check, passed in checks:
+        print(("ok: " if passed else "FAILED: ") + check)
+    if not all(passed for _, passed in checks):
+        sys.exit(1)
@@ -0,0 +1,158 @@
+"""
+Synthetic EIA-923 generation workbooks and EIA-860m status workbooks for the
+benchmarks. The layouts copy the quirks the pipeline has to handle: title
+rows above the header, the 'plant id' header in column 0 or 1, and column
+names split by newlines or underscores.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+
+GENERATION_METADATA_HEADER = [
+    'Plant Id', 'Combined Heat And\nPower Plant', 'Nuclear Unit Id',
+    'Plant Name', 'Operator Name', 'Operator Id', 'Plant State',
+    'Census Region', 'NERC Region', 'Reserved', 'NAICS Code',
+    'EIA Sector Number', 'Sector Name', 'Reported\nPrime Mover',
+    'Reported\nFuel Type Code', 'AER\nFuel Type Code',
+    'Balancing\nAuthority Code', 'Respondent\nFrequency',
+    'Physical\nUnit Label']
+
+GENERATION_VALUE_PREFIXES = ['Quantity\n', 'Elec_Quantity\n',
+                             'MMBtuPer_Unit\n', 'Tot_MMBtu\n', 'Elec_MMBtu\n',
+                             'Netgen\n']
+
+FUELS = [('NG', 'NG', 'CT'), ('SUB', 'COL', 'ST'), ('WND', 'WND', 'WT'),
+         ('SUN', 'SUN', 'PV'), ('NUC', 'NUC', 'ST'), ('DFO', 'DFO', 'IC'),
+         ('WAT', 'HYC', 'HY'), ('MWH', 'MWH', 'BA')]
+STATES = ['CA', 'TX', 'NY', 'FL', 'WA', 'IL', 'PA', 'OH']
+
+
+def generation_header(underscores=False):
+    header = GENERATION_METADATA_HEADER + [
+        prefix + month for prefix in GENERATION_VALUE_PREFIXES
+        for month in MONTHS]
+    header += ['Total Fuel Consumption\nQuantity',
+               'Net Generation\n(Megawatthours)', 'YEAR']
+    if underscores:
+        header = [x.replace("\n", "_") for x in header]
+    return header
+
+def make_generation_sheet(year, plants=100, fuel_rows=3, plant_id_column=0,
+                          underscores=False, seed=0):
+    # Raw generation sheet as it appears in the workbook, before the header
+    # row has been found
+    rng = np.random.default_rng(seed)
+    header = generation_header(underscores)
+    rows = []
+    for plant_id in range(1, plants + 1):
+        for fuel_row in range(fuel_rows):
+            fuel, mer, prime_mover = FUELS[(plant_id + fuel_row) % len(FUELS)]
+            nuclear_unit_id = fuel_row + 1 if fuel == 'NUC' else '.'
+            row = [plant_id, 'N', nuclear_unit_id, 'Plant ' + str(plant_id),
+                   'Operator ' + str(plant_id % 50), plant_id % 50,
+                   STATES[plant_id % len(STATES)], 'PACC', 'WECC', None, 22,
+                   1, 'Electric Utility', prime_mover, fuel, mer, 'CISO', 'M',
+                   'mcf']
+            values = np.round(rng.gamma(2.0, 500.0, size=72), 3).tolist()
+            # Sprinkle in the "." missing value sentinel
+            for index in rng.integers(0, 72, size=4):
+                values[index] = '.'
+            row += values + [1.0, 2.0, year]
+            rows.append(row)
+    title_rows = [['EIA-923 generation and fuel consumption time series file'] +
+                  [None] * (len(header) - 1)] * 4
+    sheet = pd.DataFrame(title_rows + [header] + rows)
+    if plant_id_column == 1:
+        sheet.insert(0, 'row', [None] * 4 + ['Row'] +
+                     list(range(1, len(rows) + 1)))
+    sheet.columns = range(len(sheet.columns))
+    return sheet
+
+def write_generation_workbook(path, year, **kwargs):
+    sheet = make_generation_sheet(year, **kwargs)
+    with pd.ExcelWriter(path) as writer:
+        sheet.to_excel(writer, sheet_name='Page 1 Generation and Fuel Data',
+                       index=False, header=False)
+        pd.DataFrame({'Notes': ['synthetic']}).to_excel(
+            writer, sheet_name='Page 7 File Layout', index=False)
+    return path
+
+def write_generation_workbooks(directory, years, plants=100, fuel_rows=3,
+                               early_release_months=(3, 5)):
+    # One final workbook per year, except the last year, which gets early
+    # release workbooks like the M_<n>_<year> files EIA posts
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for index, year in enumerate(years):
+        months = early_release_months if year == years[-1] else (12,)
+        for month in months:
+            path = os.path.join(directory, "EIA923_Schedules_2_3_4_5_M_" +
+                                str(month).zfill(2) + "_" + str(year) +
+                                "_Final.xlsx")
+            files.append(write_generation_workbook(
+                path, year, plants=plants, fuel_rows=fuel_rows,
+                plant_id_column=index % 2, underscores=index % 3 == 0,
+                seed=year * 100 + month))
+    return files
+
+def make_860m_sheet(kind, generators=200, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = ['Entity ID', 'Entity Name', 'Plant ID', 'Plant Name',
+               'Plant State', 'County', 'Balancing Authority Code', 'Sector',
+               'Unit Code', 'Technology', 'Generator ID',
+               'Nameplate Capacity\n (MW)', 'DC Net Capacity (MW)',
+               'Net Summer Capacity (MW)', 'Net Winter Capacity (MW)']
+    if kind.startswith('Planned') or kind.startswith('Canceled'):
+        columns += ['Planned Operation Month', 'Planned Operation Year']
+    else:
+        columns += ['Operating Month', 'Operating Year']
+    if kind.startswith('Retired'):
+        columns += ['Retirement Month', 'Retirement Year']
+    else:
+        columns += ['Planned Retirement Month', 'Planned Retirement Year',
+                    'Status']
+    columns += ['Energy Source Code', 'Prime Mover Code', 'Latitude',
+                'Longitude']
+    data = []
+    for index in range(generators):
+        plant_id = int(rng.integers(1, max(generators // 3, 2)))
+        row = dict()
+        for column in columns:
+            if column == 'Plant ID':
+                row[column] = plant_id
+            elif column == 'Entity ID':
+                row[column] = plant_id * 10
+            elif column == 'Generator ID':
+                row[column] = str(index % 4 + 1)
+            elif 'Capacity' in column:
+                row[column] = round(float(rng.uniform(1, 500)), 1)
+            elif column.endswith('Month'):
+                row[column] = int(rng.integers(1, 13)) if rng.random() < 0.8 else ' '
+            elif column.endswith('Year'):
+                row[column] = int(rng.integers(1950, 2030)) if rng.random() < 0.8 else ' '
+            elif column == 'Plant State':
+                row[column] = STATES[plant_id % len(STATES)]
+            elif column == 'Energy Source Code':
+                row[column] = FUELS[plant_id % len(FUELS)][0]
+            elif column == 'Status':
+                row[column] = '(OP) Operating'
+            elif column in ('Latitude', 'Longitude'):
+                row[column] = round(float(rng.uniform(25, 49)), 4)
+            else:
+                row[column] = column + " " + str(plant_id)
+        data.append([row[x] for x in columns])
+    title_rows = [[kind + ' generators'] + [None] * (len(columns) - 1),
+                  [None] * len(columns)]
+    return pd.DataFrame(title_rows + [columns] + data)
+
+def write_860m_workbook(path, generators=200, seed=0):
+    with pd.ExcelWriter(path) as writer:
+        for index, kind in enumerate(['Operating', 'Planned', 'Retired',
+                                      'Canceled or Postponed']):
+            make_860m_sheet(kind, generators, seed + index).to_excel(
+                writer, sheet_name=kind, index=False, header=False)
+    return path
@@ -0,0 +1,270 @@
+"""
+Time the stages of the 923 and 860m pipelines on synthetic fixtures, and
+write the timings, throughput and peak memory of each stage to a JSON file.
+A result can be compared against an earlier one to catch regressions in
+time or memory:
+
+    python benchmarks/run_benchmarks.py --plants 500 --years 3
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/baseline.json
+
+Runs entirely offline.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+import fixtures
+from eia import fleet_rollups, metadata, monthly
+from eia.frame_accumulator import get_peak_rss_mb
+
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+RESULTS_VERSION = 1
+
+
+def time_stage(results, stage, repeat, function, rows=None):
+    # Run function repeat times and record the fastest run. rows is a
+    # function of the result giving the number of rows the stage handled.
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    seconds = min(timings)
+    stage_rows = rows(result) if rows is not None else None
+    results[stage] = {
+        "seconds": round(seconds, 4),
+        "mean_seconds": round(sum(timings) / len(timings), 4),
+        "rows": stage_rows,
+        "rows_per_second": (round(stage_rows / seconds, 1)
+                            if stage_rows is not None and seconds > 0 else None),
+        "peak_rss_mb": get_peak_rss_mb()}
+    print(stage + ": " + str(results[stage]))
+    return result
+
+def build_fixtures(fixture_dir, args):
+    # Reuse fixtures already written at the same scale
+    scale_path = os.path.join(fixture_dir, "scale.json")
+    scale = {"plants": args.plants, "years": args.years,
+             "fuel_rows": args.fuel_rows, "generators": args.generators}
+    if os.path.exists(scale_path):
+        with open(scale_path, 'r') as file:
+            if json.load(file) == scale:
+                with open(os.path.join(fixture_dir, "files.json"), 'r') as f:
+                    return json.load(f)
+    print("Writing fixtures to " + fixture_dir)
+    years = list(range(args.first_year, args.first_year + args.years))
+    files = {
+        "generation": fixtures.write_generation_workbooks(
+            os.path.join(fixture_dir, "923"), years, plants=args.plants,
+            fuel_rows=args.fuel_rows),
+        "860m": []}
+    os.makedirs(os.path.join(fixture_dir, "860m"), exist_ok=True)
+    for index, month in enumerate(["january", "february"]):
+        files["860m"].append(fixtures.write_860m_workbook(
+            os.path.join(fixture_dir, "860m", month + "_generator" +
+                         str(years[-1]) + ".xlsx"),
+            generators=args.generators, seed=index))
+    with open(os.path.join(fixture_dir, "files.json"), 'w') as file:
+        json.dump(files, file)
+    with open(scale_path, 'w') as file:
+        json.dump(scale, file)
+    return files
+
+def run_generation_stages(monthly, files, work_dir, repeat):
+    results = dict()
+    def read_sheets():
+        raw_frames = []
+        for file in files:
+            with pd.ExcelFile(file) as excel_file:
+                raw_frames.append(monthly.read_generation_sheet(
+                    excel_file, monthly.get_generation_sheet_name(
+                        excel_file.sheet_names)))
+        return raw_frames
+
+    raw_frames = time_stage(results, "workbook_parse", repeat, read_sheets,
+                            rows=lambda r: sum(len(x) for x in r))
+
+    def normalize_headers():
+        # Start from an empty registry, so every run pays for building it
+        monthly.generation_schema_registry.clear()
+        frames = []
+        for file, raw_df in zip(files, raw_frames):
+            header_row, variant = monthly.detect_generation_schema(raw_df)
+            generation_df = monthly.apply_generation_schema(raw_df, header_row,
+                                                            variant)
+            generation_df['file'] = os.path.basename(file)
+            frames.append(monthly.apply_generation_dtypes(generation_df))
+        return frames
+
+    generation_frames = time_stage(results, "header_normalization", repeat,
+                                   normalize_headers,
+                                   rows=lambda r: sum(len(x) for x in r))
+    master_df = pd.concat(generation_frames, axis=0)
+    files_remove = time_stage(
+        results, "filter_latest_year_data", repeat,
+        lambda: monthly.filter_latest_year_data(master_df),
+        rows=lambda r: len(master_df))
+    master_df = master_df[~master_df['file'].isin(files_remove)]
+    time_series_columns = [
+        x for x in master_df.columns
+        if (x not in monthly.generation_metadata_columns
+            or x in monthly.joiner_columns)
+        and x not in monthly.removal_columns]
+    time_series_df = master_df[time_series_columns]
+
+    def build_long_format():
+        # The plant time series steps of process_master_plant_data, short of
+        # writing them (timed by output_write)
+        active_plants = monthly.get_active_plants(time_series_df,
+                                                  monthly.joiner_columns)
+        long_df = monthly.build_long_format_data(time_series_df,
+                                                 monthly.joiner_columns)
+        return active_plants, long_df
+
+    active_plants, long_df = time_stage(
+        results, "build_long_format_data", repeat, build_long_format,
+        rows=lambda r: len(r[1]))
+
+    def rollup():
+        rollups = fleet_rollups.FleetRollups()
+        rollups.add(long_df, monthly.get_plant_regions(master_df),
+                    monthly.get_sensor_groups(time_series_df))
+        return rollups.build()
+
+    time_stage(results, "fleet_rollups", repeat, rollup,
+               rows=lambda r: len(long_df))
+    plants = list(master_df["PLANT ID"].drop_duplicates())
+    output_dir = os.path.join(work_dir, "923_monthly_production")
+    os.makedirs(output_dir, exist_ok=True)
+    time_stage(
+        results, "output_write", repeat,
+        lambda: monthly.write_plant_csvs(long_df, plants, active_plants,
+                                         output_dir=output_dir),
+        rows=lambda r: len(long_df))
+    return results
+
+def run_860m_stages(metadata, files, repeat):
+    results = dict()
+    frames = time_stage(
+        results, "860m_workbook_parse", repeat,
+        lambda: [df for x in files
+                 for df in metadata.read_860m_workbook(x, x)],
+        rows=lambda r: sum(len(x) for x in r))
+    # The pipeline resets the index before standardizing the dates
+    master_df = pd.concat(frames, axis=0, ignore_index=True)
+    time_stage(
+        results, "get_latest_snapshot", repeat,
+        lambda: metadata.get_latest_snapshot(master_df),
+        rows=lambda r: len(master_df))
+    time_stage(
+        results, "get_standardized_operating_year", repeat,
+        lambda: metadata.get_standardized_operating_year(master_df.copy()),
+        rows=lambda r: len(master_df))
+    return results
+
+def get_change(before, after):
+    # Change from before to after, as a fraction of before
+    if before is None or after is None or before <= 0:
+        return 0
+    return (after - before) / before
+
+def compare_results(results, baseline, threshold, memory_threshold):
+    # Stages more than threshold (a fraction) slower than the baseline, or
+    # whose peak memory grew by more than memory_threshold. Peak memory is
+    # the process peak once the stage has run.
+    regressions = []
+    for stage, stats in results["stages"].items():
+        if stage not in baseline.get("stages", dict()):
+            continue
+        before = baseline["stages"][stage]
+        change = get_change(before["seconds"], stats["seconds"])
+        memory_change = get_change(before.get("peak_rss_mb"),
+                                   stats["peak_rss_mb"])
+        print(stage + ": " + str(before["seconds"]) + "s -> " +
+              str(stats["seconds"]) + "s (" + str(round(change * 100, 1)) +
+              "%), " + str(before.get("peak_rss_mb")) + "MB -> " +
+              str(stats["peak_rss_mb"]) + "MB (" +
+              str(round(memory_change * 100, 1)) + "%)")
+        if change > threshold:
+            regressions.append(stage)
+        elif memory_change > memory_threshold:
+            regressions.append(stage + " (memory)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline "
+                                     "stages on synthetic EIA fixtures.")
+    parser.add_argument("--plants", type=int, default=200,
+                        help="Number of plants in each 923 workbook.")
+    parser.add_argument("--years", type=int, default=3,
+                        help="Number of years of 923 workbooks.")
+    parser.add_argument("--first-year", type=int, default=2020)
+    parser.add_argument("--fuel-rows", type=int, default=3,
+                        help="Number of fuel rows per plant.")
+    parser.add_argument("--generators", type=int, default=500,
+                        help="Number of generators per 860m status sheet.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per stage. The fastest run is recorded.")
+    parser.add_argument("--fixture-dir",
+                        default=os.path.join(BENCHMARK_DIR, ".fixtures"),
+                        help="Directory of the generated fixtures, reused "
+                        "between runs at the same scale.")
+    parser.add_argument("--output",
+                        default=os.path.join(RESULTS_DIR, "latest.json"),
+                        help="File the results are written to.")
+    parser.add_argument("--compare",
+                        help="Results file to compare against. Exits with "
+                        "status 1 if any stage got slower or used more "
+                        "memory.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Slowdown, as a fraction, counted as a "
+                        "regression by --compare.")
+    parser.add_argument("--memory-threshold", type=float, default=0.2,
+                        help="Growth in peak memory, as a fraction, counted "
+                        "as a regression by --compare.")
+    args = parser.parse_args()
+    files = build_fixtures(args.fixture_dir, args)
+    stages = dict()
+    with tempfile.TemporaryDirectory() as work_dir:
+        stages.update(run_generation_stages(monthly, files["generation"],
+                                            work_dir, args.repeat))
+    stages.update(run_860m_stages(metadata, files["860m"], args.repeat))
+    results = {
+        "version": RESULTS_VERSION,
+        "run_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "scale": {"plants": args.plants, "years": args.years,
+                  "fuel_rows": args.fuel_rows,
+                  "generators": args.generators, "repeat": args.repeat},
+        "environment": {"python": platform.python_version(),
+                        "pandas": pd.__version__,
+                        "platform": platform.platform(),
+                        "cpu_count": os.cpu_count()},
+        "stages": stages,
+        "peak_rss_mb": get_peak_rss_mb()}
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=1)
+    print("Results written to " + args.output)
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        if baseline.get("scale") != results["scale"]:
+            print("WARNING: baseline was run at a different scale")
+        regressions = compare_results(results, baseline, args.threshold,
+                                      args.memory_threshold)
+        if regressions:
+            print("REGRESSED: " + ", ".join(regressions))
+            sys.exit(1)
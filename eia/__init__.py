@@ -0,0 +1,7 @@
+"""
+EIA 860m and 923 data pipelines. The generate-metadata and
+generate-monthly-data commands run eia.metadata and eia.monthly. Importing
+the package or any of its modules is cheap: pandas, numpy and the HTTP
+libraries are only loaded once they are used, and the code lookup tables
+are read on first use.
+"""
@@ -0,0 +1,27 @@
+"""
+Lazy imports, so importing the pipeline modules for a single helper doesn't
+pay for loading pandas and numpy until they are actually used.
+"""
+
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    # The module, loaded on its first attribute access. Modules that are
+    # already imported are returned as they are.
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+def preload(*modules):
+    # Finish loading lazily imported modules, e.g. before starting worker
+    # processes that would otherwise each import them again
+    for module in modules:
+        getattr(module, "__name__")
@@ -0,0 +1,79 @@
+"""
+Spill data frames to disk split into buckets, so a dataset too large to hold
+in memory can be processed a few buckets at a time. Rows are routed to a
+bucket by a key computed by the caller (e.g. from the plant ID), so all rows
+with the same key end up in the same bucket, in the order they were added.
+"""
+
+import logging
+import math
+import os
+import shutil
+import tempfile
+from ._lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
+
+SPILL_DIR = "./.cache/spill"
+BUCKETS = 64
+
+
+class BucketSpill:
+    # Each added frame is written as one piece per bucket, including empty
+    # pieces, so every bucket sees the columns of every frame. The in-memory
+    # size of each bucket is tracked to plan which buckets to load together.
+
+    def __init__(self, spill_dir=SPILL_DIR, buckets=BUCKETS):
+        os.makedirs(spill_dir, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix="spill-", dir=spill_dir)
+        self.buckets = buckets
+        self.pieces = 0
+        self.bucket_bytes = [0] * buckets
+
+    def add(self, df, bucket_keys):
+        # bucket_keys holds the bucket number of each row of df
+        bucket_keys = np.asarray(bucket_keys)
+        for bucket in range(self.buckets):
+            piece = df[bucket_keys == bucket]
+            self.bucket_bytes[bucket] += int(piece.memory_usage(deep=True).sum())
+            piece.to_pickle(self._get_piece_path(bucket, self.pieces))
+        self.pieces += 1
+
+    def _get_piece_path(self, bucket, piece):
+        return os.path.join(self.path, str(bucket) + "-" + str(piece) + ".pkl")
+
+    def plan_chunks(self, budget_bytes, factor=1):
+        # Group consecutive buckets into chunks whose data, times factor for
+        # the working copies made while processing it, fits in budget_bytes.
+        # A bucket larger than the budget gets a chunk of its own.
+        chunks = []
+        chunk = []
+        chunk_bytes = 0
+        for bucket in range(self.buckets):
+            bucket_bytes = self.bucket_bytes[bucket] * factor
+            if len(chunk) > 0 and chunk_bytes + bucket_bytes > budget_bytes:
+                chunks.append(chunk)
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(bucket)
+            chunk_bytes += bucket_bytes
+        if len(chunk) > 0:
+            chunks.append(chunk)
+        logger.info("Planned %s chunks of %s buckets for a %s MB budget",
+                    len(chunks), self.buckets,
+                    math.ceil(budget_bytes / 1024 ** 2))
+        return chunks
+
+    def read(self, buckets):
+        # Pieces of the given buckets, in the order the frames were added
+        frames = []
+        for piece in range(self.pieces):
+            for bucket in buckets:
+                frames.append(pd.read_pickle(self._get_piece_path(bucket, piece)))
+        return frames
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
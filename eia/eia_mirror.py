@@ -0,0 +1,124 @@
+"""
+Keep a local mirror of the files published on the EIA website. Files are
+fetched concurrently over a pooled session, skipped when the server says
+they haven't changed (ETag / Last-Modified), and resumed from where they
+stopped if a download is interrupted. The pipeline scripts then read only
+from the mirror.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+INDEX_FILE = "index.json"
+
+
+def get_session(pool_size=8, retries=3):
+    # The HTTP libraries are only needed once something is downloaded
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=Retry(total=retries, backoff_factor=1,
+                                            status_forcelist=[500, 502, 503, 504]))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def list_links(url, pattern, session=None, verify=False):
+    # Links on the page at url whose href matches pattern, in page order
+    from bs4 import BeautifulSoup as bs
+    session = session or get_session()
+    soup = bs(session.get(url, verify=verify).text, 'html.parser')
+    links = []
+    for link in soup.findAll("a", attrs={'href': re.compile(pattern)}):
+        if link.get('href') not in links:
+            links.append(link.get('href'))
+    return links
+
+def get_mirror_path(url, mirror_dir):
+    return os.path.join(mirror_dir, urlparse(url).path.lstrip("/"))
+
+def _read_meta(path):
+    if not os.path.exists(path + ".meta.json"):
+        return dict()
+    with open(path + ".meta.json", 'r') as file:
+        return json.load(file)
+
+def _write_meta(path, meta):
+    with open(path + ".meta.json", 'w') as file:
+        json.dump(meta, file)
+
+def fetch_file(url, path, session=None, verify=False):
+    # Download url to path. Returns "not_modified", "downloaded" or "resumed".
+    session = session or get_session()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    meta = _read_meta(path)
+    part_path = path + ".part"
+    headers = dict()
+    validator = meta.get("etag") or meta.get("last_modified")
+    if os.path.exists(part_path) and validator:
+        # Resume the partial download, as long as the file hasn't changed
+        headers["Range"] = "bytes=" + str(os.path.getsize(part_path)) + "-"
+        headers["If-Range"] = validator
+    elif os.path.exists(path):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    with session.get(url, headers=headers, stream=True, verify=verify,
+                     timeout=60) as response:
+        if response.status_code == 304:
+            return "not_modified"
+        if response.status_code == 416:
+            # The partial file can't be resumed, so start over
+            os.remove(part_path)
+            return fetch_file(url, path, session=session, verify=verify)
+        response.raise_for_status()
+        resumed = response.status_code == 206
+        meta = {"url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified")}
+        # Record the validators first, so an interrupted download can resume
+        _write_meta(path, meta)
+        with open(part_path, 'ab' if resumed else 'wb') as file:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                file.write(chunk)
+    os.replace(part_path, path)
+    return "resumed" if resumed else "downloaded"
+
+def mirror_files(urls, mirror_dir, workers=4, session=None, verify=False):
+    # Fetch urls into mirror_dir, at most workers at a time. Returns
+    # {url: (path, status)}, where status is None if the fetch failed.
+    session = session or get_session(pool_size=workers)
+
+    def fetch(url):
+        path = get_mirror_path(url, mirror_dir)
+        try:
+            status = fetch_file(url, path, session=session, verify=verify)
+            logger.info("%s %s", status, url)
+        except Exception as e:
+            print("Could not process the following file: " + url)
+            logger.error("Could not fetch %s: %s", url, e)
+            status = None
+        return url, (path, status)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(fetch, urls))
+
+def write_index(mirror_dir, links):
+    # Keep the page order of the links, so offline runs match online runs
+    os.makedirs(mirror_dir, exist_ok=True)
+    with open(os.path.join(mirror_dir, INDEX_FILE), 'w') as file:
+        json.dump(links, file, indent=1)
+
+def read_index(mirror_dir):
+    with open(os.path.join(mirror_dir, INDEX_FILE), 'r') as file:
+        return json.load(file)
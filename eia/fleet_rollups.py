@@ -0,0 +1,137 @@
+"""
+Fleet-level monthly totals of the 923 data, by state, balancing authority,
+fuel group and for the whole country. They are computed from the long format
+data while the plants are built, and kept as small materialized tables, so
+fleet questions don't need every plant's file opened and joined to the
+metadata. On incremental runs only the years whose source files changed are
+recomputed.
+"""
+
+import logging
+import os
+from ._lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_DIR = "./923_rollups"
+# Base table every rollup is summed from: one row per state, balancing
+# authority, fuel group, month and metric
+CUBE_COLUMNS = ['state', 'balancing_authority_code', 'fuel_group',
+                'fuel_category', 'measured_on', 'metric']
+CUBE_NAME = "fleet_cube"
+# Rollup table name, and the cube columns it keeps
+ROLLUPS = {"national_monthly": [],
+           "state_monthly": ['state'],
+           "balancing_authority_monthly": ['balancing_authority_code'],
+           "fuel_group_monthly": ['fuel_group', 'fuel_category']}
+
+
+def build_cube(long_df, plant_regions, sensor_groups):
+    # Sum the long data into the cube in one groupby. plant_regions is
+    # indexed by plant ID with state and balancing_authority_code columns,
+    # and sensor_groups by sensor name with fuel_group, fuel_category and
+    # metric columns. The groups are looked up once per distinct plant and
+    # sensor, and grouped on as categoricals.
+    plant_codes, plants = pd.factorize(long_df['PLANT ID'],
+                                      use_na_sentinel=False)
+    sensor_codes, sensors = pd.factorize(long_df['sensor_name'],
+                                        use_na_sentinel=False)
+    plant_regions = plant_regions.reindex(plants)
+    sensor_groups = sensor_groups.reindex(sensors)
+    columns = dict()
+    for column in ['state', 'balancing_authority_code']:
+        columns[column] = _take_categorical(plant_regions[column], plant_codes)
+    for column in ['fuel_group', 'fuel_category']:
+        columns[column] = _take_categorical(sensor_groups[column], sensor_codes)
+    columns['measured_on'] = long_df['measured_on'].to_numpy()
+    columns['metric'] = _take_categorical(sensor_groups['metric'], sensor_codes)
+    columns['value'] = long_df['value'].to_numpy()
+    cube_df = pd.DataFrame(columns)
+    cube_df = cube_df.groupby(CUBE_COLUMNS, dropna=False, sort=False,
+                              observed=True)['value'].sum().reset_index()
+    return cube_df.astype({x: object for x in CUBE_COLUMNS
+                           if x != 'measured_on'})
+
+def _take_categorical(values, codes):
+    # values[codes] as a categorical, built from the distinct values only
+    value_codes, categories = pd.factorize(values.to_numpy(dtype=object))
+    return pd.Categorical.from_codes(value_codes[codes], categories)
+
+def _get_path(rollup_dir, name):
+    return os.path.join(rollup_dir, name + ".csv")
+
+def has_rollups(rollup_dir=ROLLUP_DIR):
+    return os.path.exists(_get_path(rollup_dir, CUBE_NAME))
+
+def read_rollup(name, rollup_dir=ROLLUP_DIR, start=None, end=None, **filters):
+    # A materialized table, optionally cut to the months between start and
+    # end and to rows where each column=value given (or column=[values])
+    # Values are parsed exactly as written, so tables rewritten from the ones
+    # already on disk don't drift in the last digit
+    df = pd.read_csv(_get_path(rollup_dir, name), parse_dates=['measured_on'],
+                     keep_default_na=False, na_values=[""],
+                     float_precision='round_trip')
+    keep = pd.Series(True, index=df.index)
+    if start is not None:
+        keep &= df['measured_on'] >= pd.Timestamp(start)
+    if end is not None:
+        keep &= df['measured_on'] <= pd.Timestamp(end)
+    for column, value in filters.items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        keep &= df[column].isin(values)
+    return df[keep].reset_index(drop=True)
+
+
+class FleetRollups:
+    # Collects the cube of each batch of plants built in a run (the whole
+    # fleet at once, or one chunk at a time in streaming mode). Every plant
+    # is built in a single batch, so the batch cubes only need to be added.
+
+    def __init__(self):
+        self.cubes = []
+
+    def add(self, long_df, plant_regions, sensor_groups):
+        if len(long_df) > 0:
+            self.cubes.append(build_cube(long_df, plant_regions,
+                                         sensor_groups))
+
+    def build(self):
+        if len(self.cubes) == 0:
+            # No plants were built, e.g. an incremental run with no changes
+            return pd.DataFrame(columns=CUBE_COLUMNS + ['value']).astype(
+                {'measured_on': 'datetime64[ns]', 'value': 'float64'})
+        cube_df = pd.concat(self.cubes, axis=0, ignore_index=True)
+        return cube_df.groupby(CUBE_COLUMNS, dropna=False,
+                               observed=True)['value'].sum().reset_index()
+
+    def write(self, rollup_dir=ROLLUP_DIR, replace_years=None):
+        # Write the cube and the rollups. By default they are rebuilt from
+        # this run alone. If replace_years is given, only those years are
+        # taken from this run and every other year is kept from the tables
+        # already written.
+        cube_df = self.build()
+        if replace_years is not None:
+            replace_years = set(int(x) for x in replace_years)
+            if len(replace_years) == 0 and has_rollups(rollup_dir):
+                # Nothing changed, so the tables already written stand
+                logger.info("No changed years, keeping the fleet rollups "
+                            "in %s", rollup_dir)
+                return read_rollup(CUBE_NAME, rollup_dir)
+            cube_df = cube_df[cube_df['measured_on'].dt.year.isin(replace_years)]
+            if has_rollups(rollup_dir):
+                old_df = read_rollup(CUBE_NAME, rollup_dir)
+                old_df = old_df[~old_df['measured_on'].dt.year.isin(replace_years)]
+                cube_df = pd.concat([old_df, cube_df], axis=0, ignore_index=True)
+        cube_df = cube_df.sort_values(CUBE_COLUMNS, kind='stable',
+                                      na_position='last').reset_index(drop=True)
+        os.makedirs(rollup_dir, exist_ok=True)
+        cube_df.to_csv(_get_path(rollup_dir, CUBE_NAME), index=False)
+        for name, columns in ROLLUPS.items():
+            rollup_df = cube_df.groupby(columns + ['measured_on', 'metric'],
+                                        dropna=False)['value'].sum().reset_index()
+            rollup_df.to_csv(_get_path(rollup_dir, name), index=False)
+        logger.info("Wrote fleet rollups to %s: %s cube rows", rollup_dir,
+                    len(cube_df))
+        return cube_df
@@ -0,0 +1,143 @@
+"""
+Collect data frames piece by piece and concatenate them once at the end,
+rather than growing a master frame with pd.concat inside a loop (which
+copies the whole frame on every iteration).
+"""
+
+import logging
+import sys
+import time
+from ._lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def get_peak_rss_mb():
+    # Peak resident memory of this process in MB, or None if unknown
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    if sys.platform == "darwin":
+        return round(peak / 1024 ** 2, 1)
+    return round(peak / 1024, 1)
+
+
+class FrameAccumulator:
+    # Pieces are cast to any explicitly given dtypes and aligned to the union
+    # of their columns, in order of first appearance, before the single
+    # concatenation, so the result matches repeated pd.concat calls.
+    # Columns that are categorical in every piece stay categorical, with the
+    # union of the pieces' categories. Columns missing from a piece, or with
+    # no values in it, are filled with missing values of the column's dtype
+    # in the other pieces.
+
+    def __init__(self, name, dtypes=None):
+        self.name = name
+        self.dtypes = dict() if dtypes is None else dict(dtypes)
+        self.frames = []
+        self.columns = dict()
+        self.rows = 0
+        self.start_time = time.perf_counter()
+        self.stats = None
+
+    def add(self, df):
+        if df is None:
+            return
+        for column in df.columns:
+            self.columns.setdefault(column, None)
+        self.frames.append(df)
+        self.rows += len(df)
+
+    def __len__(self):
+        return self.rows
+
+    def _get_category_dtypes(self, frames):
+        # Categories of the columns that are categorical wherever they appear.
+        # Without a shared dtype, pd.concat turns them back into objects.
+        categories = dict()
+        for df in frames:
+            for column in df.columns:
+                if not isinstance(df[column].dtype, pd.CategoricalDtype):
+                    categories[column] = None
+                elif categories.get(column, []) is not None:
+                    categories.setdefault(column, dict()).update(
+                        dict.fromkeys(df[column].cat.categories))
+        return {x: pd.CategoricalDtype(list(y)) for x, y in categories.items()
+                if y is not None}
+
+    def _get_fill_dtypes(self, frames, target_dtypes):
+        # Dtype of the missing values filled in for a column a piece lacks:
+        # its target dtype, or else its dtype where it first holds values
+        # (where it first appears, if it never does). NumPy integers and
+        # booleans can't hold missing values, so those get the float and
+        # object columns pd.concat would have made of them.
+        fill_dtypes = dict()
+        for df in frames:
+            for column, dtype in df.dtypes.items():
+                if column not in fill_dtypes or (
+                        fill_dtypes[column][1] and df[column].notna().any()):
+                    fill_dtypes[column] = (dtype, df[column].isna().all())
+        fill_dtypes = {x: y[0] for x, y in fill_dtypes.items()}
+        for column, dtype in fill_dtypes.items():
+            if isinstance(dtype, np.dtype) and dtype.kind in "iu":
+                fill_dtypes[column] = np.dtype('float64')
+            elif isinstance(dtype, np.dtype) and dtype.kind == "b":
+                fill_dtypes[column] = np.dtype(object)
+        fill_dtypes.update(target_dtypes)
+        return fill_dtypes
+
+    def _cast(self, df, dtypes):
+        dtypes = {x: y for x, y in dtypes.items()
+                  if x in df.columns and df[x].dtype != y}
+        if len(dtypes) > 0:
+            df = df.astype(dtypes)
+        return df
+
+    def build(self):
+        if len(self.frames) == 0:
+            master_df = pd.DataFrame()
+        else:
+            columns = list(self.columns)
+            # Explicit dtypes first, so e.g. text cast to category still gets
+            # the union of the categories
+            frames = [self._cast(df, self.dtypes) for df in self.frames]
+            self.frames = []
+            target_dtypes = self._get_category_dtypes(frames)
+            fill_dtypes = self._get_fill_dtypes(frames, target_dtypes)
+            for i, df in enumerate(frames):
+                # Columns holding no values don't take part in the result's
+                # dtype, as pd.concat is deprecating leaving them out
+                missing = [x for x in columns if x not in df.columns or (
+                    df[x].dtype != fill_dtypes[x] and df[x].isna().all())]
+                if len(missing) > 0:
+                    df = df.assign(**{x: pd.Series(index=df.index,
+                                                   dtype=fill_dtypes[x])
+                                      for x in missing})
+                if list(df.columns) != columns:
+                    df = df[columns]
+                frames[i] = self._cast(df, target_dtypes)
+            master_df = pd.concat(frames, axis=0)
+            del frames
+        # The pieces are no longer needed once they have been combined
+        self.frames = []
+        elapsed = time.perf_counter() - self.start_time
+        self.stats = {
+            "name": self.name,
+            "rows": self.rows,
+            "columns": len(master_df.columns),
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed > 0 else None,
+            "frame_mb": round(float(master_df.memory_usage(deep=False).sum()) / 1024 ** 2, 1),
+            "peak_rss_mb": get_peak_rss_mb()}
+        logger.info("Built %s: %s", self.name, self.stats)
+        return master_df
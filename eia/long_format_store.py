@@ -0,0 +1,140 @@
+"""
+Columnar store for the 923 monthly data in long format: one row per plant,
+month and sensor, written as a Parquet dataset partitioned by year or by
+state. Reads push plant, sensor, date and partition filters down to
+Parquet, so fleet-wide questions don't require opening a file per plant.
+"""
+
+import os
+import shutil
+from ._lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+STORE_PATH = "./923_long_format"
+PARTITION_COLUMNS = ["year", "state"]
+# Value pyarrow uses for a missing partition key
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+ROW_GROUP_SIZE = 100000
+
+
+def build_store_frame(long_df, plant_states):
+    # Convert the long frame built by process_master_plant_data into the
+    # store layout. plant_states maps str(plant ID) to its state.
+    store_df = pd.DataFrame({
+        'plant_id': long_df['PLANT ID'].astype(str),
+        'measured_on': long_df['measured_on'],
+        'sensor_name': long_df['sensor_name'].astype(str),
+        'value': long_df['value'].astype('float64')})
+    store_df['year'] = store_df['measured_on'].dt.year.astype('int32')
+    store_df['state'] = store_df['plant_id'].map(plant_states)
+    return store_df
+
+def _get_partition_path(path, partition_by, value):
+    if pd.isna(value):
+        value = NULL_PARTITION
+    return os.path.join(path, partition_by + "=" + str(value))
+
+def _list_partitions(path, partition_by):
+    if not os.path.isdir(path):
+        return []
+    prefix = partition_by + "="
+    return [os.path.join(path, x) for x in os.listdir(path)
+            if x.startswith(prefix)]
+
+def _write_partition(df, partition_path):
+    # Sort so the row group statistics on plant_id and measured_on are tight,
+    # which is what lets Parquet skip row groups on read
+    df = df.sort_values(['plant_id', 'measured_on', 'sensor_name'],
+                        kind='stable').reset_index(drop=True)
+    os.makedirs(partition_path, exist_ok=True)
+    file = os.path.join(partition_path, "part-0.parquet")
+    temp_file = file + ".tmp"
+    df.to_parquet(temp_file, index=False, row_group_size=ROW_GROUP_SIZE)
+    os.replace(temp_file, file)
+
+def has_store(path=STORE_PATH, partition_by="year"):
+    return len(_list_partitions(path, partition_by)) > 0
+
+def clear_long_format_store(path=STORE_PATH):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+
+def write_long_format_store(store_df, path=STORE_PATH, partition_by="year",
+                            replace_plants=None):
+    # Write the store, partitioned by year or state. By default the whole
+    # store is rewritten. If replace_plants is given, only the rows of those
+    # plants are replaced and every other plant's rows are kept.
+    if partition_by not in PARTITION_COLUMNS:
+        raise ValueError("partition_by must be one of " +
+                         ", ".join(PARTITION_COLUMNS))
+    file_columns = [x for x in store_df.columns if x != partition_by]
+    if replace_plants is None:
+        clear_long_format_store(path)
+        for value, partition_df in store_df.groupby(partition_by, dropna=False):
+            _write_partition(partition_df[file_columns],
+                             _get_partition_path(path, partition_by, value))
+        return
+    replace_plants = set(str(x) for x in replace_plants)
+    new_partitions = dict()
+    for value, partition_df in store_df.groupby(partition_by, dropna=False):
+        new_partitions[_get_partition_path(path, partition_by, value)] = \
+            partition_df[file_columns]
+    # Existing partitions may hold rows for the replaced plants, even when
+    # no new rows land in them
+    partition_paths = set(_list_partitions(path, partition_by)) | set(new_partitions)
+    for partition_path in sorted(partition_paths):
+        file = os.path.join(partition_path, "part-0.parquet")
+        frames = []
+        changed = False
+        if os.path.exists(file):
+            existing_df = pd.read_parquet(file)
+            keep = ~existing_df['plant_id'].isin(replace_plants)
+            changed = not keep.all()
+            frames.append(existing_df[keep])
+        if partition_path in new_partitions:
+            frames.append(new_partitions[partition_path])
+            changed = True
+        if not changed:
+            continue
+        partition_df = pd.concat(frames, axis=0)
+        if len(partition_df) == 0:
+            shutil.rmtree(partition_path)
+        else:
+            _write_partition(partition_df[file_columns], partition_path)
+
+def read_long_format(path=STORE_PATH, plant_ids=None, sensor_names=None,
+                     start=None, end=None, years=None, states=None,
+                     columns=None):
+    # Read the rows matching every filter given. Filters on the partition
+    # column prune whole partitions, the rest skip row groups.
+    filters = []
+    if plant_ids is not None:
+        filters.append(('plant_id', 'in', [str(x) for x in plant_ids]))
+    if sensor_names is not None:
+        filters.append(('sensor_name', 'in', list(sensor_names)))
+    if start is not None:
+        filters.append(('measured_on', '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append(('measured_on', '<=', pd.Timestamp(end)))
+    if years is not None:
+        filters.append(('year', 'in', [int(x) for x in years]))
+    if states is not None:
+        filters.append(('state', 'in', list(states)))
+    df = pd.read_parquet(path, columns=columns,
+                         filters=filters if len(filters) > 0 else None)
+    for column in PARTITION_COLUMNS:
+        # Partition columns come back as categoricals
+        if column in df.columns and isinstance(df[column].dtype,
+                                               pd.CategoricalDtype):
+            df[column] = df[column].astype(
+                'int32' if column == 'year' else object)
+    return df
+
+def read_plant_wide(plant_id, path=STORE_PATH, start=None, end=None):
+    # The wide frame for one plant, as written to 923_monthly_production/
+    plant_df = read_long_format(path, plant_ids=[plant_id], start=start,
+                                end=end,
+                                columns=['measured_on', 'sensor_name', 'value'])
+    return plant_df.pivot(index='measured_on', columns='sensor_name',
+                          values='value')
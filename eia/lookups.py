@@ -0,0 +1,102 @@
+"""
+Code lookup tables used by the pipelines, e.g. energy source and prime mover
+code descriptions. Each table is read the first time it is used rather than
+when a module is imported. The tables ship with the package in eia/data, so
+the pipelines can run from any directory.
+"""
+
+import functools
+import importlib.resources
+import json
+import logging
+import os
+from ._lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
+
+# Directory to read the tables from instead of the packaged copies, e.g. to
+# try out an updated code key. Set it (or EIA_LOOKUP_DIR) before first use.
+LOOKUP_DIR = os.environ.get("EIA_LOOKUP_DIR")
+# Lookup name, and the file, key column and value column it comes from
+LOOKUP_TABLES = {
+    "energy_source": ("eia_energy_code_key.csv", "Energy Source Code",
+                      "Energy Source Description"),
+    "fuel_group": ("eia_energy_code_key.csv", "Energy Source Code",
+                   "Grouping"),
+    "prime_mover": ("Prime_Mover_Codes.csv", "Prime Mover Code",
+                    "Prime Mover Description"),
+    "mer_fuel": ("eia_mer_fuel_type_codes.csv", "fuel_code", "description"),
+    "mer_category": ("eia_mer_fuel_type_codes.csv", "fuel_code", "category")}
+# The energy source key lists WAT under both hydro groups, so the fuel group
+# of a shared code is taken from the MER fuel code, or else the prime mover
+SHARED_CODE_FUEL_GROUPS = {
+    "mer": {"HYC": "Hydroelectric Conventional",
+            "HPS": "Hydroelectric Pumped Storage"},
+    "prime_mover": {"HY": "Hydroelectric Conventional",
+                    "PS": "Hydroelectric Pumped Storage"}}
+
+
+def open_lookup_file(file):
+    if LOOKUP_DIR is not None:
+        return open(os.path.join(LOOKUP_DIR, file), 'r')
+    return importlib.resources.files(__package__).joinpath(
+        "data", file).open('r')
+
+@functools.lru_cache(maxsize=None)
+def read_lookup_csv(file):
+    with open_lookup_file(file) as handle:
+        return pd.read_csv(handle)
+
+@functools.lru_cache(maxsize=None)
+def read_lookup_pairs(name):
+    # Distinct (code, value) rows of one of LOOKUP_TABLES, and whether each
+    # code appears with more than one value
+    file, key, value = LOOKUP_TABLES[name]
+    lookup_df = read_lookup_csv(file)[[key, value]].drop_duplicates()
+    return lookup_df[key], lookup_df[value], lookup_df[key].duplicated(keep=False)
+
+@functools.lru_cache(maxsize=None)
+def get_lookup(name):
+    # Dict of code to value for one of LOOKUP_TABLES. A code listed with two
+    # different values is an error, rather than letting the last row win.
+    codes, values, shared = read_lookup_pairs(name)
+    if shared.any():
+        raise ValueError(LOOKUP_TABLES[name][0] +
+                         " lists " + ", ".join(sorted(set(codes[shared]))) +
+                         " with more than one " + LOOKUP_TABLES[name][2])
+    return dict(zip(codes, values))
+
+def get_fuel_groups(fuel, prime_mover, mer):
+    # Fuel group of each (energy source, prime mover, MER fuel code) row.
+    # Codes listed under more than one group are resolved through
+    # SHARED_CODE_FUEL_GROUPS, to one of the groups the key lists for them.
+    codes, values, shared = read_lookup_pairs("fuel_group")
+    shared_pairs = set(zip(codes[shared], values[shared]))
+    missing = (set(x[1] for x in shared_pairs) -
+               set(SHARED_CODE_FUEL_GROUPS["mer"].values()) -
+               set(SHARED_CODE_FUEL_GROUPS["prime_mover"].values()))
+    if missing:
+        raise ValueError("No rule to resolve the fuel "
+                         "groups " + ", ".join(sorted(missing)))
+    groups = fuel.map(dict(zip(codes[~shared], values[~shared])))
+    resolved = mer.map(SHARED_CODE_FUEL_GROUPS["mer"])
+    resolved = resolved.where(
+        resolved.notna(),
+        prime_mover.map(SHARED_CODE_FUEL_GROUPS["prime_mover"]))
+    is_shared = fuel.isin(set(codes[shared]))
+    is_valid = pd.Series([x in shared_pairs for x in zip(fuel, resolved)],
+                         index=fuel.index)
+    if (is_shared & ~is_valid).any():
+        logger.warning("No fuel group for %s",
+                       sorted(set(zip(fuel[is_shared & ~is_valid],
+                                      prime_mover[is_shared & ~is_valid],
+                                      mer[is_shared & ~is_valid])), key=str))
+    return groups.where(~is_shared, resolved.where(is_valid))
+
+@functools.lru_cache(maxsize=None)
+def get_state_renames():
+    # Standard name of each state spelling found in the 860m data
+    with open_lookup_file("state_renamer_dict.json") as file:
+        return json.load(file)
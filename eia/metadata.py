@@ -0,0 +1,282 @@
+"""
+Pull down all of the EIA Form 860m data from the EIA website and process it.
+Insert data into associated utility_plants and utility_energy_types tables.
+"""
+
+import os
+import argparse
+import logging
+import time
+from .frame_accumulator import FrameAccumulator
+from . import eia_mirror
+from . import metadata_index
+from . import lookups
+from .run_profiler import RunProfiler
+from ._lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+URL = "https://www.eia.gov/electricity/data/eia860m/"
+
+def get_standardized_operating_year(df):
+    df['planned_operating_year_month'] = (
+        df['Planned Operation Year'].astype(str)
+        + "-" + df['Planned Operation Month'].astype(str) + "-01")
+    df['operating_year_month'] = (
+        df['Operating Year'].astype(str) 
+        + "-" + df['Operating Month'].astype(str) + "-01")
+    df.loc[
+        ((df['operating_year_month'] == "nan-nan-01") &
+        (df['planned_operating_year_month'] != "nan-nan-01")),
+        'operating_year_month'] = df['planned_operating_year_month']
+    df['planned_retirement_year_month'] = (
+        df['Planned Retirement Year'].astype(str) 
+        + "-" + df['Planned Retirement Month'].astype(str) + "-01")
+    df.loc[
+        (df['planned_retirement_year_month'] == ' - -01') |
+        (df['planned_retirement_year_month'] == 'nan-nan-01'),
+        'planned_retirement_year_month'] = None
+    df.loc[
+        (df['operating_year_month'] == ' - -01') |
+        (df['operating_year_month'] == 'nan-nan-01'),
+        'operating_year_month'] = None
+    return df['operating_year_month'], df['planned_retirement_year_month']
+
+def get_soup(URL):
+    import requests
+    from bs4 import BeautifulSoup as bs
+    return bs(requests.get(URL, verify=False).text, 'html.parser')
+
+
+# Sheets read from each 860m workbook, in order. "file" is the suffix added
+# to the file tag, and retired sheets get their retirement columns renamed
+# and a fixed status.
+sheet_table = [
+    {"sheet": "Operating", "file": "_op", "retired": False},
+    {"sheet": "Planned", "file": "_planned", "retired": False},
+    {"sheet": "Operating_PR", "file": "_op_pr", "retired": False},
+    {"sheet": "Planned_PR", "file": "_planned_pr", "retired": False},
+    {"sheet": "Canceled or Postponed", "file": "_cancel", "retired": False},
+    {"sheet": "Retired", "file": "_retired", "retired": True},
+    {"sheet": "Retired_PR", "file": "_retired_pr", "retired": True},
+    ]
+
+retired_column_renames = {'Retirement Month':'Planned Retirement Month',
+                          'Retirement Year': 'Planned Retirement Year'}
+retired_status = \
+    '(OS) Out of service and NOT expected to return to service in next calendar year'
+
+
+def pullXLSXFile(sheet_name, excel_file):
+    df = excel_file.parse(sheet_name)
+    index_cutoff = df[df[df.columns[0]] =='Entity ID'].index[0]
+    df.columns = list(df.iloc[index_cutoff])
+    df = df[df.index > index_cutoff]
+    return df
+
+def read_860m_workbook(file_path, file_link):
+    # Open the workbook once and yield each sheet in sheet_table that it
+    # contains, with the sheet's transforms applied
+    with pd.ExcelFile(file_path, engine='openpyxl') as excel_file:
+        sheet_names = excel_file.sheet_names
+        for sheet in sheet_table:
+            if sheet["sheet"] not in sheet_names:
+                continue
+            df = pullXLSXFile(sheet["sheet"], excel_file)
+            if sheet["retired"]:
+                # Rename the retirement columns
+                df = df.rename(columns=retired_column_renames)
+            df["file"] = file_link + sheet["file"]
+            if sheet["retired"]:
+                df['Status'] = retired_status
+            df.columns = [x.replace("\n", "").lstrip() for x in df.columns]
+            yield df
+
+def get_file_report_year(files):
+    # Report year of each distinct file tag, e.g. "2024" for
+    # "/.../january_generator2024.xlsx_op"
+    files = files.drop_duplicates()
+    return dict(zip(files, [os.path.basename(x).split(".")[0].replace(
+        "_generator", " ").split(" ")[-1] for x in files]))
+
+def get_file_report_date(files):
+    # Report date of each distinct file tag, e.g. 2024-01-01 for
+    # "/.../january_generator2024.xlsx_op"
+    files = files.drop_duplicates()
+    return dict(zip(files, [pd.to_datetime(os.path.basename(x).split(".")[0].replace(
+        "_generator", " 1, ").upper()) for x in files]))
+
+def get_latest_snapshot(df):
+    # Keep the rows from the latest 860m report: the latest report year of
+    # each plant, then the latest report date of each (Plant ID, Generator ID)
+    # within that year. Every row at the latest date is kept. The file names
+    # are only parsed once each, then joined back onto the rows.
+    df = df.copy()
+    df['report_year'] = df['file'].map(get_file_report_year(df['file']))
+    # Compare the years on sorted category codes, which keeps the string
+    # ordering of the years without a string comparison per row
+    report_year_code = pd.Series(pd.Categorical(
+        df['report_year'], categories=sorted(df['report_year'].dropna().unique()),
+        ordered=True).codes, index=df.index)
+    report_year_max = report_year_code.groupby(df["Plant ID"]).transform("max")
+    df = df[report_year_code == report_year_max]
+    df['report_date'] = df['file'].map(get_file_report_date(df['file']))
+    report_date_max = df.groupby(["Plant ID", "Generator ID"])[
+        'report_date'].transform("max")
+    return df[df['report_date'] == report_date_max]
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, 
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        filename='app.log', 
+                        force=True,
+                        filemode='a')
+    parser = argparse.ArgumentParser(description="Build eia_metadata.csv from "
+                                     "the EIA 860m data.")
+    parser.add_argument("--mirror-dir", default="./860m_mirror",
+                        help="Directory of the local mirror of the 860m files.")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Number of files downloaded at the same time.")
+    parser.add_argument("--offline", action="store_true",
+                        help="Use the files already in the mirror, without "
+                        "checking the EIA website for updates.")
+    parser.add_argument("--summary-path",
+                        default="./eia_metadata_run_summary.json",
+                        help="File the JSON run summary is written to.")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Run under cProfile and dump the stats to PATH.")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Track allocations with tracemalloc. Slows the "
+                        "run down noticeably.")
+    parser.add_argument("--top-n", type=int, default=10,
+                        help="Number of slowest files listed in the run "
+                        "summary.")
+    parser.add_argument("--index-dir", default=metadata_index.INDEX_DIR,
+                        help="Directory of the lookup indexes built over "
+                        "eia_metadata.csv.")
+    args = parser.parse_args(argv)
+    profiler = RunProfiler("860m", profile_path=args.profile,
+                           trace_memory=args.trace_memory, top_n=args.top_n)
+    # Pull down the 860M data into the local mirror
+    with profiler.stage("download") as record:
+        if args.offline:
+            file_links = eia_mirror.read_index(args.mirror_dir)
+        else:
+            file_links = eia_mirror.list_links(URL, ".xlsx")
+            eia_mirror.mirror_files(["https://www.eia.gov" + x for x in file_links],
+                                    args.mirror_dir, workers=args.workers)
+            eia_mirror.write_index(args.mirror_dir, file_links)
+        record["rows_out"] = len(file_links)
+    # The file tag repeats on every row of a sheet, so it's stored as a
+    # category across all of the workbooks
+    accumulator_860m = FrameAccumulator("860m", dtypes={'file': 'category'})
+    with profiler.stage("parse_workbooks", len(file_links)) as record:
+        for file_link in file_links:
+            print(file_link)
+            file_path = eia_mirror.get_mirror_path("https://www.eia.gov" + file_link,
+                                                   args.mirror_dir)
+            if not os.path.exists(file_path):
+                print("ERROR ENCOUNTERED: " + file_link)
+                profiler.record_file(file_link, 0, error="missing from mirror")
+                continue
+            start = time.perf_counter()
+            try:
+                for df in read_860m_workbook(file_path, file_link):
+                    accumulator_860m.add(df)
+                    # Each sheet is timed from the end of the previous one
+                    sheet = df['file'].iloc[0][len(file_link):] if len(df) else None
+                    profiler.record_file(file_link, time.perf_counter() - start,
+                                         rows=len(df), sheet=sheet)
+                    start = time.perf_counter()
+            except Exception as e:
+                print(e)
+                print("ERROR ENCOUNTERED: " + file_link)
+                profiler.record_file(file_link, time.perf_counter() - start,
+                                     error=repr(e))
+        master_860m_data_pre = accumulator_860m.build()
+        record["rows_out"] = len(master_860m_data_pre)
+    print(accumulator_860m.stats)
+    master_860m_data = master_860m_data_pre.drop_duplicates()
+    master_860m_data = master_860m_data[~master_860m_data['Plant Name'].isna()]
+    # State renamer dictionary to standardize the state column
+    master_860m_data['Plant State'] = master_860m_data[
+        'Plant State'].map(lookups.get_state_renames()).fillna(master_860m_data['Plant State'])
+    # Get the latest reporting period for each entry (when the 860m data was generated)
+    with profiler.stage("get_latest_snapshot", len(master_860m_data)) as record:
+        master_860m_data = get_latest_snapshot(master_860m_data)
+        record["rows_out"] = len(master_860m_data)
+    # Convert prime mover code to full name
+    prime_mover_df = lookups.read_lookup_csv("eia_energy_code_key.csv")
+    master_860m_data = pd.merge(master_860m_data, prime_mover_df, 
+                                on="Energy Source Code", how='left')
+    master_860m_data = master_860m_data.rename(columns={"Grouping": "Prime Mover Group",
+                                                        "Energy Source Description": "Prime Mover"})
+    # Cleaned up data for insertion
+    master_860m_data_clean = master_860m_data[['Entity ID', 'Entity Name', 'Plant ID', 
+                                               'Plant Name', 'Plant State', 'County', 
+                                               'Balancing Authority Code',
+                                               'Sector', 'Unit Code', 'Technology',
+                                               'Generator ID', 
+                                               'Nameplate Capacity (MW)',
+                                               'DC Net Capacity (MW)',
+                                               'Net Summer Capacity (MW)',
+                                               'Net Winter Capacity (MW)',
+                                               'Operating Month',
+                                               'Operating Year',
+                                               'Planned Operation Month',
+                                               'Planned Operation Year',
+                                               'Planned Retirement Month',
+                                               'Planned Retirement Year',   
+                                               'Prime Mover', 
+                                               "Prime Mover Group",
+                                               'Status',
+                                               'Latitude', 
+                                               'Longitude',
+                                               'report_date', 
+                                               'file']].drop_duplicates()
+    master_860m_data_clean = master_860m_data_clean.reset_index(drop=True)
+    # Clean up the dataframe for DB insertion
+    with profiler.stage("get_standardized_operating_year",
+                        len(master_860m_data_clean)) as record:
+        master_860m_data_clean['operating_year_month'], master_860m_data_clean[
+            'planned_retirement_year_month'] = \
+            get_standardized_operating_year(master_860m_data_clean)
+        record["rows_out"] = len(master_860m_data_clean)
+    master_860m_data_clean = master_860m_data_clean.drop(
+        columns=['planned_operating_year_month', 'Entity ID',
+                 'Operating Month','Operating Year',	'Planned Operation Month',	
+                 'Planned Operation Year',	'Planned Retirement Month',	
+                 'Planned Retirement Year'])
+    master_860m_data_clean = master_860m_data_clean.rename(columns={
+        "Plant ID": "plant_id",
+        "Generator ID": "generator_id",
+        "Technology": "technology",
+        'Nameplate Capacity (MW)': 'nameplate_capacity_mw',
+        'report_date': "last_status_date",
+        "Status": "status",
+        'Plant Name': "plant_name",
+        'Plant State': "state",
+        'County': "county", 
+        'Balancing Authority Code': "balancing_authority_code",
+        'Latitude': "latitude", 
+        'Longitude': "longitude",
+        'Prime Mover': 'prime_mover',
+        'Prime Mover Group': 'prime_mover_group',
+        'Entity Name': 'utility_name',
+        'Entity ID': 'entity_id',
+        'Sector': 'sector',
+        'Unit Code': 'unit_code',
+        'DC Net Capacity (MW)': 'dc_net_capacity_mw', 
+        'Net Summer Capacity (MW)': 'net_summer_capacity_mw',
+        'Net Winter Capacity (MW)': 'net_winter_capacity_mw'
+        })
+    with profiler.stage("write_metadata", len(master_860m_data_clean)):
+        master_860m_data_clean.to_csv("eia_metadata.csv", index=False)
+    with profiler.stage("build_index", len(master_860m_data_clean)):
+        metadata_index.build_index("eia_metadata", index_dir=args.index_dir)
+    profiler.count("files", len(file_links))
+    profiler.write_summary(args.summary_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Persistent indexes over the metadata written by the pipeline scripts, so a
+service can look up a plant, the generators in a state or balancing
+authority, or the plants in a lat/long box without loading and scanning the
+whole CSV. Columns and indexes are stored as .npy files and memory-mapped on
+load, so opening an index only reads its manifest.
+
+    index = metadata_index.open_index("eia_metadata")
+    index.lookup(plant_id=3)
+    index.lookup(state="Texas", status="(OP) Operating")
+    index.within_bbox(29.5, -95.8, 30.2, -95.0)
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+from ._lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = "./metadata_index"
+INDEX_VERSION = 1
+# Size of the cells of the spatial grid, in degrees of latitude and longitude
+GRID_DEGREES = 0.5
+# What to index in each output. "keys" are exact match indexes looked up by
+# hash, "sorted" also support range queries, and "spatial" is the latitude
+# and longitude columns of the grid index.
+INDEX_SPECS = {
+    "eia_metadata": {
+        "source": "eia_metadata.csv",
+        "keys": [["plant_id"], ["plant_id", "generator_id"]],
+        "sorted": ["state", "balancing_authority_code", "status"],
+        "spatial": ["latitude", "longitude"]},
+    "generation_923": {
+        "source": "./923_metadata/generation_923_metadata.csv",
+        "keys": [["PLANT ID"]],
+        "sorted": ["STATE", "BALANCING AUTHORITY CODE",
+                   "REPORTED FUEL TYPE CODE"],
+        "spatial": None}}
+# Joins the values of a multi-column key
+KEY_SEPARATOR = "\x1f"
+
+
+def _get_source_stamp(source):
+    stat = os.stat(source)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def _to_keys(values):
+    # Key strings, so 3, 3.0 and "3" are the same key. Missing values are "".
+    values = pd.Series(values)
+    if values.dtype.kind == 'f' and (values.dropna() % 1 == 0).all():
+        values = values.astype('Int64')
+    return values.astype(object).where(values.notna(), "").astype(str)
+
+def _to_key(value):
+    # _to_keys for a single value
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, (float, np.floating)) and value % 1 == 0:
+        return str(int(value))
+    return str(value)
+
+def _get_key(values):
+    return KEY_SEPARATOR.join(_to_key(x) for x in values)
+
+def _build_groups(keys):
+    # Exact match index over keys: the sorted distinct keys, and the rows of
+    # each key as rows[offsets[i]:offsets[i + 1]]
+    rows = np.argsort(keys, kind='stable')
+    sorted_keys = keys[rows]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    offsets = np.r_[starts, len(keys)].astype('int64')
+    return sorted_keys[starts], offsets, rows.astype('int64')
+
+def _get_cells(latitude, longitude, grid_degrees):
+    # Grid cell number of each point. Rows without a location get -1.
+    lat_cells = np.floor((latitude + 90) / grid_degrees)
+    lon_cells = np.floor((longitude + 180) / grid_degrees)
+    columns = int(np.ceil(360 / grid_degrees)) + 1
+    cells = lat_cells * columns + lon_cells
+    return np.where(np.isnan(cells), -1, cells).astype('int64'), columns
+
+def _save(index_path, name, values):
+    np.save(os.path.join(index_path, name + ".npy"), values,
+            allow_pickle=False)
+
+def build_index(name, source=None, index_dir=INDEX_DIR):
+    # Build the index of one of INDEX_SPECS from its source CSV, replacing
+    # any earlier build
+    spec = INDEX_SPECS[name]
+    source = spec["source"] if source is None else source
+    df = pd.read_csv(source, low_memory=False)
+    os.makedirs(index_dir, exist_ok=True)
+    build_path = tempfile.mkdtemp(prefix=name + "-", dir=index_dir)
+    manifest = {"version": INDEX_VERSION, "name": name,
+                "source": os.path.abspath(source),
+                "source_stamp": _get_source_stamp(source), "rows": len(df),
+                "columns": [], "text_columns": [], "keys": [], "sorted": [],
+                "spatial": None}
+    # Columns are stored as numbers or as fixed width strings, both of which
+    # can be memory-mapped
+    for position, column in enumerate(df.columns):
+        values = df[column]
+        if values.dtype.kind in 'biuf':
+            _save(build_path, "column-" + str(position), values.to_numpy())
+        else:
+            _save(build_path, "column-" + str(position),
+                  _to_keys(values).to_numpy(dtype=str))
+            manifest["text_columns"].append(column)
+        manifest["columns"].append(column)
+    for position, columns in enumerate(spec["keys"]):
+        keys = _to_keys(df[columns[0]])
+        for column in columns[1:]:
+            keys = keys + KEY_SEPARATOR + _to_keys(df[column])
+        for part, values in zip(["keys", "offsets", "rows"],
+                                _build_groups(keys.to_numpy(dtype=str))):
+            _save(build_path, "key-" + str(position) + "-" + part, values)
+        manifest["keys"].append(columns)
+    for column in spec["sorted"]:
+        position = len(manifest["sorted"])
+        groups = _build_groups(_to_keys(df[column]).to_numpy(dtype=str))
+        for part, values in zip(["keys", "offsets", "rows"], groups):
+            _save(build_path, "sorted-" + str(position) + "-" + part, values)
+        manifest["sorted"].append(column)
+    if spec["spatial"] is not None:
+        latitude, longitude = spec["spatial"]
+        cells, grid_columns = _get_cells(
+            pd.to_numeric(df[latitude], errors='coerce').to_numpy(dtype='float64'),
+            pd.to_numeric(df[longitude], errors='coerce').to_numpy(dtype='float64'),
+            GRID_DEGREES)
+        for part, values in zip(["keys", "offsets", "rows"],
+                                _build_groups(cells)):
+            _save(build_path, "spatial-" + part, values)
+        manifest["spatial"] = {"columns": [latitude, longitude],
+                               "grid_degrees": GRID_DEGREES,
+                               "grid_columns": grid_columns}
+    with open(os.path.join(build_path, "index.json"), 'w') as file:
+        json.dump(manifest, file, indent=1)
+    index_path = os.path.join(index_dir, name)
+    if os.path.isdir(index_path):
+        shutil.rmtree(index_path)
+    os.replace(build_path, index_path)
+    logger.info("Built metadata index %s: %s rows", name, len(df))
+    return index_path
+
+def open_index(name, index_dir=INDEX_DIR, rebuild=True):
+    # Open an index, building it first if it is missing, out of date with
+    # its source, or from an older version of this module
+    index_path = os.path.join(index_dir, name)
+    if rebuild:
+        index = None
+        if os.path.exists(os.path.join(index_path, "index.json")):
+            index = MetadataIndex(index_path)
+        if index is None or index.is_stale():
+            build_index(name, index_dir=index_dir)
+    return MetadataIndex(index_path)
+
+
+class MetadataIndex:
+    # Lookups return row positions (find, find_range, find_in_bbox) or the
+    # rows themselves as records (lookup, lookup_range, within_bbox).
+    # Arrays are only mapped when first used, and the hash tables of the key
+    # indexes are only built on their first lookup.
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.json"), 'r') as file:
+            self.manifest = json.load(file)
+        self.columns = self.manifest["columns"]
+        self.text_columns = set(self.manifest["text_columns"])
+        self.arrays = dict()
+        self.hash_tables = dict()
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def is_stale(self):
+        source = self.manifest["source"]
+        if self.manifest["version"] != INDEX_VERSION:
+            return True
+        if not os.path.exists(source):
+            return False
+        return _get_source_stamp(source) != self.manifest["source_stamp"]
+
+    def _array(self, name):
+        if name not in self.arrays:
+            self.arrays[name] = np.load(os.path.join(self.path, name + ".npy"),
+                                        mmap_mode='r')
+        return self.arrays[name]
+
+    def _column(self, column):
+        return self._array("column-" + str(self.columns.index(column)))
+
+    def _group_rows(self, prefix, positions):
+        offsets = self._array(prefix + "-offsets")
+        rows = self._array(prefix + "-rows")
+        if len(positions) == 0:
+            return np.empty(0, dtype='int64')
+        return np.concatenate([rows[offsets[x]:offsets[x + 1]]
+                               for x in positions])
+
+    def _find_key(self, position, key):
+        prefix = "key-" + str(position)
+        if prefix not in self.hash_tables:
+            keys = self._array(prefix + "-keys")
+            self.hash_tables[prefix] = dict(zip(keys.tolist(),
+                                                range(len(keys))))
+        group = self.hash_tables[prefix].get(key)
+        return self._group_rows(prefix, [] if group is None else [group])
+
+    def _find_sorted(self, position, values):
+        prefix = "sorted-" + str(position)
+        keys = self._array(prefix + "-keys")
+        groups = []
+        for value in values:
+            key = _to_key(value)
+            group = np.searchsorted(keys, key)
+            if group < len(keys) and keys[group] == key:
+                groups.append(group)
+        return self._group_rows(prefix, groups)
+
+    def find(self, **criteria):
+        # Rows matching every column=value given. A value can be a list of
+        # values for a sorted index. A key index over exactly the given
+        # columns is used if there is one, otherwise the rows found through
+        # each column's own index are intersected.
+        columns = list(criteria)
+        if len(columns) == 0:
+            raise ValueError("No criteria given")
+        for position, key_columns in enumerate(self.manifest["keys"]):
+            if sorted(key_columns) == sorted(columns) and not any(
+                    isinstance(criteria[x], (list, tuple, set))
+                    for x in columns):
+                return self._find_key(position, _get_key(
+                    [criteria[x] for x in key_columns]))
+        rows = None
+        for column, value in criteria.items():
+            if [column] in self.manifest["keys"] and not isinstance(
+                    value, (list, tuple, set)):
+                found = self._find_key(self.manifest["keys"].index([column]),
+                                       _to_key(value))
+            elif column in self.manifest["sorted"]:
+                values = value if isinstance(value, (list, tuple, set)) else [value]
+                found = self._find_sorted(
+                    self.manifest["sorted"].index(column), values)
+            else:
+                raise KeyError("No index on " + column)
+            rows = found if rows is None else np.intersect1d(rows, found)
+        return np.sort(rows)
+
+    def find_range(self, column, low=None, high=None):
+        # Rows whose value of a sorted column is between low and high,
+        # inclusive, comparing the values as strings
+        position = self.manifest["sorted"].index(column)
+        prefix = "sorted-" + str(position)
+        keys = self._array(prefix + "-keys")
+        start = 0 if low is None else np.searchsorted(keys, _to_key(low))
+        end = len(keys) if high is None else np.searchsorted(
+            keys, _to_key(high), 'right')
+        offsets = self._array(prefix + "-offsets")
+        return np.sort(self._array(prefix + "-rows")[offsets[start]:offsets[end]])
+
+    def find_in_bbox(self, min_latitude, min_longitude, max_latitude,
+                     max_longitude):
+        # Rows located inside the box, edges included. Only the grid cells
+        # overlapping the box are read, then each of their points is checked.
+        spatial = self.manifest["spatial"]
+        if spatial is None:
+            raise KeyError("No spatial index on " + self.manifest["name"])
+        grid_degrees = spatial["grid_degrees"]
+        grid_columns = spatial["grid_columns"]
+        keys = self._array("spatial-keys")
+        offsets = self._array("spatial-offsets")
+        rows = self._array("spatial-rows")
+        lat_start, lon_start = [int(np.floor((x + y) / grid_degrees)) for x, y
+                                in [(min_latitude, 90), (min_longitude, 180)]]
+        lat_end, lon_end = [int(np.floor((x + y) / grid_degrees)) for x, y
+                            in [(max_latitude, 90), (max_longitude, 180)]]
+        candidates = []
+        # The cells of one grid row that overlap the box are consecutive keys
+        for lat_cell in range(lat_start, lat_end + 1):
+            start = np.searchsorted(keys, lat_cell * grid_columns + lon_start)
+            end = np.searchsorted(keys, lat_cell * grid_columns + lon_end,
+                                  'right')
+            if end > start:
+                candidates.append(rows[offsets[start]:offsets[end]])
+        if len(candidates) == 0:
+            return np.empty(0, dtype='int64')
+        candidates = np.concatenate(candidates)
+        latitude = self._column(spatial["columns"][0])[candidates]
+        longitude = self._column(spatial["columns"][1])[candidates]
+        inside = ((latitude >= min_latitude) & (latitude <= max_latitude) &
+                  (longitude >= min_longitude) & (longitude <= max_longitude))
+        return np.sort(candidates[inside])
+
+    def records(self, rows, columns=None):
+        # Rows as dicts. Missing text comes back as None.
+        columns = self.columns if columns is None else columns
+        values = dict()
+        for column in columns:
+            column_values = self._column(column)[rows].tolist()
+            if column in self.text_columns:
+                column_values = [None if x == "" else x for x in column_values]
+            values[column] = column_values
+        return [dict(zip(columns, x)) for x in zip(*values.values())]
+
+    def frame(self, rows, columns=None):
+        columns = self.columns if columns is None else columns
+        df = pd.DataFrame({x: self._column(x)[rows] for x in columns})
+        for column in self.text_columns.intersection(columns):
+            df[column] = df[column].replace("", None)
+        return df
+
+    def lookup(self, **criteria):
+        return self.records(self.find(**criteria))
+
+    def lookup_range(self, column, low=None, high=None):
+        return self.records(self.find_range(column, low, high))
+
+    def within_bbox(self, min_latitude, min_longitude, max_latitude,
+                    max_longitude):
+        return self.records(self.find_in_bbox(min_latitude, min_longitude,
+                                              max_latitude, max_longitude))
@@ -0,0 +1,1055 @@
+"""
+Pull the EIA 923 data. This is monthly production data for all
+generators in the United States.
+"""
+
+
+import re
+import glob
+import zipfile
+from collections import Counter, deque
+import datetime
+import logging
+import os
+import argparse
+import hashlib
+import json
+from functools import partial
+import time
+from . import workbook_cache
+from .frame_accumulator import FrameAccumulator
+from . import long_format_store
+from . import eia_mirror
+from . import bucket_spill
+from . import sheet_router
+from . import metadata_index
+from . import fleet_rollups
+from . import lookups
+from .run_profiler import RunProfiler, profile_stage
+from ._lazy import lazy_import, preload
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+URL = "https://www.eia.gov/electricity/data/eia923/"
+
+
+# Column mappings that we want to clean up
+column_mappings = {"JANUARY": "JAN",
+                   "FEBRUARY": "FEB",
+                   "MARCH":"MAR",
+                   "APRIL": "APR",
+                   "JUNE": "JUN",
+                   "JULY": "JUL",
+                   "AUGUST": "AUG",
+                   "SEPTEMBER": "SEP",
+                   "OCTOBER": "OCT",
+                   "NOVEMBER": "NOV",
+                   "DECEMBER": "DEC",
+                   "ELECTRIC": "ELEC",
+                   "&": "AND",
+                   "MMBTUJAN": "MMBTU JAN",
+                   "MMBTUFEB": "MMBTU FEB",
+                   "MMBTUMAR": "MMBTU MAR",
+                   "MMBTUAPR": "MMBTU APR",
+                   "MMBTUMAY": "MMBTU MAY",
+                   "MMBTUJUN": "MMBTU JUN",
+                   "MMBTUJUL": "MMBTU JUL",
+                   "MMBTUAUG": "MMBTU AUG",
+                   "MMBTUSEP": "MMBTU SEP",
+                   "MMBTUOCT": "MMBTU OCT",
+                   "MMBTUNOV": "MMBTU NOV",
+                   "MMBTUDEC": "MMBTU DEC",
+                   "MMBTUPER": "MMBTU PER",
+                   "MMBTUS": "MMBTU",
+                   "NUCLEAR UNIT I.D.": "NUCLEAR UNIT ID",
+                   "PLANT STATE": "STATE",
+                   "RESERVED ": "RESERVED",
+                   'AER FUEL TYPE CODE': 'MER FUEL TYPE CODE'
+                   }
+
+# Bump this whenever parse_generation_workbook changes its output, so frames
+# cached by older versions of the logic are not reused
+GENERATION_CACHE_VERSION = 4
+
+# Schema variants seen so far, keyed by the signature of the raw header row.
+# Each EIA layout era has its own header, so the header only has to be
+# normalized once per era rather than once per workbook.
+generation_schema_registry = dict()
+
+
+def normalize_column_name(name):
+    # Standardize a raw generation sheet header, e.g. "Netgen\nJanuary" to
+    # "NETGEN JAN"
+    name = name.replace("\n", " ").replace("_", " ").upper()
+    for month in column_mappings:
+        name = name.replace(month, column_mappings[month])
+    return name
+
+def get_header_signature(header):
+    return hashlib.sha1("\x1f".join(str(x) for x in header).encode("utf-8")
+                        ).hexdigest()
+
+def get_generation_schema(header):
+    # Look up the schema variant of a raw header row, building it the first
+    # time the header is seen. The variant holds the positions of the columns
+    # to keep and their standardized names. Duplicated columns (after the
+    # first) and the columns process_master_plant_data drops are not kept.
+    signature = get_header_signature(header)
+    if signature not in generation_schema_registry:
+        names = [normalize_column_name(x) for x in header]
+        usecols = []
+        columns = []
+        for position, name in enumerate(names):
+            if name in columns or name in removal_columns:
+                continue
+            usecols.append(position)
+            columns.append(name)
+        generation_schema_registry[signature] = {"signature": signature,
+                                                 "usecols": usecols,
+                                                 "columns": columns,
+                                                 "header_rows": set()}
+    return generation_schema_registry[signature]
+
+def _is_plant_id(value):
+    return isinstance(value, str) and value.lower() == 'plant id'
+
+def find_generation_header(raw_df):
+    # Row position of the 'plant id' header row in a sheet read without a
+    # header, checking rows where known variants had their header first
+    known_rows = set()
+    for variant in generation_schema_registry.values():
+        known_rows.update(variant["header_rows"])
+    for row in sorted(known_rows):
+        if (row < len(raw_df) and get_header_signature(raw_df.iloc[row])
+                in generation_schema_registry):
+            return row
+    # The header is in column 1 when the sheet has a leading column, which
+    # takes precedence over column 0
+    for column in raw_df.columns[1::-1]:
+        matches = [i for i, x in enumerate(raw_df[column]) if _is_plant_id(x)]
+        if len(matches) > 0:
+            return matches[0]
+    return None
+
+def get_generation_sheet_name(sheet_names):
+    # Name of the generation sheet of a 923 workbook, or None if it has none
+    generation_sheet = [x for x in sheet_names if "generation" in x.lower()]
+    if len(generation_sheet) == 0:
+        return None
+    return generation_sheet[0]
+
+def read_generation_sheet(excel_file, sheet_name):
+    # Read the raw sheet without a header. Values are kept as read from the
+    # workbook, with "." sentinels as strings, rather than having pandas
+    # infer column types across the title rows.
+    return excel_file.parse(sheet_name, header=None, dtype=object)
+
+def detect_generation_schema(raw_df):
+    # Find the header row of a raw sheet and its schema variant. Returns
+    # (header row position, variant).
+    header_row = find_generation_header(raw_df)
+    if header_row is None:
+        raise ValueError("No 'plant id' header row found")
+    variant = get_generation_schema(list(raw_df.iloc[header_row]))
+    variant["header_rows"].add(header_row)
+    return header_row, variant
+
+def apply_generation_schema(raw_df, header_row, variant):
+    # Keep the data rows below the header and the columns of the variant.
+    # The openpyxl and xlrd readers load every cell of the sheet whatever
+    # skiprows or usecols say, so the rows and columns are picked here
+    # rather than in the read.
+    generation_df = raw_df.iloc[header_row + 1:, variant["usecols"]]
+    generation_df.columns = variant["columns"]
+    # Number the rows from the header row, as they were when the whole sheet
+    # was read with the first row as its header
+    generation_df.index = pd.RangeIndex(header_row, header_row +
+                                        len(generation_df))
+    return generation_df
+
+def parse_generation_sheet(excel_file, sheet_name, file):
+    # Read the generation sheet of an open 923 workbook with standardized
+    # headers
+    raw_df = read_generation_sheet(excel_file, sheet_name)
+    header_row, variant = detect_generation_schema(raw_df)
+    generation_df = apply_generation_schema(raw_df, header_row, variant)
+    generation_df['file'] = os.path.basename(file)
+    return apply_generation_dtypes(generation_df)
+
+def parse_generation_workbook(file):
+    # Read the generation sheet of a single 923 workbook. Returns None if the
+    # workbook has no generation sheet.
+    file = file.replace("~$", "")
+    with pd.ExcelFile(file) as excel_file:
+        sheet_name = get_generation_sheet_name(excel_file.sheet_names)
+        if sheet_name is None:
+            return None
+        return parse_generation_sheet(excel_file, sheet_name, file)
+
+def apply_generation_dtypes(generation_df):
+    # Cast a parsed generation sheet to its compact typed schema: nullable
+    # ints for the plant ID and the year, categoricals for names and codes
+    # (which keep their "." entries as written), and float64 for the monthly
+    # values and anything else, with the "." sentinel as NA. The columns are converted
+    # as arrays and put together in one new frame.
+    columns = dict()
+    for column in generation_df.columns:
+        values = generation_df[column].to_numpy(dtype=object)
+        if column in generation_int_columns:
+            columns[column] = sheet_router.to_nullable_int(values)
+        elif column in generation_category_columns:
+            columns[column] = sheet_router.to_category(values)
+        else:
+            columns[column] = pd.to_numeric(values, errors='coerce').astype('float64')
+    return pd.DataFrame(columns, index=generation_df.index)
+
+def parse_workbook(file, cache_dir=None, file_hash=None):
+    # Read the generation sheet and the routed schedule tables of a single
+    # 923 workbook. Returns (generation_df, tables, cached), where tables maps
+    # table name to frame and cached is None if the workbook had nothing to
+    # read. The sheet names are probed first, so such workbooks are never
+    # opened, and the generation sheet and the tables are each read back from
+    # the cache when the workbook hasn't changed. file_hash is the workbook's
+    # hash, if already computed.
+    file = file.replace("~$", "")
+    sheet_names = sheet_router.list_sheet_names(file)
+    generation_sheet = get_generation_sheet_name(sheet_names)
+    routes = sheet_router.route_sheets(sheet_names, file)
+    if generation_sheet is None and len(routes) == 0:
+        return None, dict(), None
+    generation_hit, generation_df = generation_sheet is None, None
+    tables_hit, tables = len(routes) == 0, dict()
+    if cache_dir is not None:
+        if file_hash is None:
+            file_hash = workbook_cache.hash_file(file)
+        if not generation_hit:
+            generation_hit, generation_df = workbook_cache.read_cached_frame(
+                file, "generation", GENERATION_CACHE_VERSION, cache_dir,
+                file_hash)
+        if not tables_hit:
+            tables_hit, tables = workbook_cache.read_cached_frame(
+                file, "schedules", sheet_router.SCHEDULE_CACHE_VERSION,
+                cache_dir, file_hash)
+    if generation_hit and tables_hit:
+        return generation_df, tables, True
+    # Open the workbook once for everything that has to be parsed
+    with pd.ExcelFile(file) as excel_file:
+        if not generation_hit:
+            generation_df = parse_generation_sheet(excel_file,
+                                                   generation_sheet, file)
+            if cache_dir is not None:
+                workbook_cache.write_cached_frame(
+                    file, generation_df, "generation",
+                    GENERATION_CACHE_VERSION, cache_dir, file_hash)
+        if not tables_hit:
+            tables = sheet_router.parse_routed_sheets(
+                excel_file, routes, os.path.basename(file))
+            if cache_dir is not None:
+                workbook_cache.write_cached_frame(
+                    file, tables, "schedules",
+                    sheet_router.SCHEDULE_CACHE_VERSION, cache_dir, file_hash)
+    return generation_df, tables, False
+
+def _parse_workbook_safe(file, cache_dir=None):
+    # Worker wrapper, so one bad workbook doesn't take down the whole run.
+    # The parse time is measured here, as the worker may be another process.
+    # The workbook is hashed once, here, for both the cache and the run
+    # manifest.
+    start = time.perf_counter()
+    file_hash = None
+    try:
+        file_hash = workbook_cache.hash_file(file.replace("~$", ""))
+        generation_df, tables, cached = parse_workbook(file, cache_dir,
+                                                       file_hash)
+        error = None
+    except Exception as e:
+        generation_df, tables, cached, error = None, dict(), None, repr(e)
+    return file, generation_df, tables, error, {
+        "seconds": time.perf_counter() - start, "cached": cached,
+        "sha256": file_hash}
+
+def read_workbooks(files, workers=1, cache_dir=None):
+    # Parse the workbooks one file per worker. Results are yielded as
+    # (file, generation_df, tables, error, parse stats) in the same order as
+    # files, so the output matches the serial path.
+    parse = partial(_parse_workbook_safe, cache_dir=cache_dir)
+    if workers is None or workers <= 1 or len(files) <= 1:
+        for file in files:
+            yield parse(file)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    preload(np, pd)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Only a couple of workbooks per worker are in flight at a time, so
+        # parsed frames don't pile up here while waiting for an earlier file
+        pending = deque()
+        for file in files:
+            pending.append(executor.submit(parse, file))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+# Columns of the master generation data
+generation_metadata_columns = ['PLANT ID', 'COMBINED HEAT AND POWER PLANT',
+                               'NUCLEAR UNIT ID', 'PLANT NAME', 'OPERATOR NAME',
+                               'OPERATOR ID', 'STATE', 'CENSUS REGION',
+                               'NERC REGION', 'RESERVED', 'NAICS CODE',
+                               'EIA SECTOR NUMBER', 'SECTOR NAME',
+                               'REPORTED PRIME MOVER',
+                               'REPORTED FUEL TYPE CODE', 
+                               'MER FUEL TYPE CODE',
+                               'BALANCING AUTHORITY CODE',
+                               'RESPONDENT FREQUENCY',
+                               'PHYSICAL UNIT LABEL']
+removal_columns = ['EARLY RELEASE DATA (JUN 2025).\xa0 NOT FULLY EDITED, USE WITH CAUTION.\xa0 DO NOT AGGREGATE TO STATE, REGIONAL, OR NATIONAL TOTALS.',
+                   'TOTAL FUEL CONSUMPTION QUANTITY',
+                   'ELEC FUEL CONSUMPTION QUANTITY',
+                   'TOTAL FUEL CONSUMPTION MMBTU',
+                   'ELEC FUEL CONSUMPTION MMBTU',
+                   'NET GENERATION (MEGAWATTHOURS)'    
+                    ]
+joiner_columns = ["PLANT ID", "PLANT NAME", 'REPORTED PRIME MOVER',
+                  'REPORTED FUEL TYPE CODE', 'MER FUEL TYPE CODE', 
+                  'NUCLEAR UNIT ID',
+                  'COMBINED HEAT AND POWER PLANT', "YEAR", 'file']
+# Typed schema applied when a workbook is parsed. Columns not listed here
+# hold the monthly values and are stored as floats. The other ID and code
+# columns (e.g. OPERATOR ID, NAICS CODE) are only written to the metadata,
+# so they stay categoricals that keep their "." entries.
+generation_int_columns = ['PLANT ID', 'YEAR']
+generation_category_columns = [x for x in generation_metadata_columns + ['file']
+                               if x not in generation_int_columns]
+
+def filter_latest_year_data(df):
+    # Delete all data from the latest year that is not from the most recent
+    # data load (as this data can change before being finally recorded).
+    # YEAR is already numeric, so the frame is read without being copied.
+    if 'YEAR' not in df.columns or len(df) == 0:
+        # No generation data, e.g. only Schedule 6/7 or 8 workbooks
+        return []
+    max_year = df['YEAR'].max()
+    max_year_files = list(df.loc[(df['YEAR'] == max_year).fillna(False),
+                                 'file'].drop_duplicates())
+    file_match_dict = dict()
+    year = str(int(max_year))
+    for file in max_year_files:
+        match = re.search(rf'M_(\d+)_{year}', file)
+        file_match_dict[file] = int(match.group(1))
+    # get the latest file in the sequence, and build list of file data
+    # we want to remove
+    max_value = max(file_match_dict.values())
+    removal_files = [key for key, value in file_match_dict.items()
+                     if value != max_value]
+    return removal_files
+
+# Suffix added to the sensor name for each metric found in the variable name.
+# Later entries win if a variable contains more than one metric.
+sensor_suffix_dict = {"NETGEN": " - Generation",
+                      "GROSSGEN": " - Gross Generation",
+                      "ELEC MMBTU": " - Quantity Consumed For Electricity",
+                      "TOT MMBTU": " - Total Fuel Consumed"}
+
+
+def get_sensor_suffix(variable):
+    suffix = None
+    for metric in sensor_suffix_dict:
+        if metric in variable:
+            suffix = sensor_suffix_dict[metric]
+    return suffix
+
+def get_active_plants(time_series_df, joiner_columns):
+    # Plants that have at least one reported monthly value. Each of these
+    # gets an output file, even if none of its values map to a sensor.
+    value_columns = [x for x in time_series_df.columns
+                     if x not in joiner_columns and x.split(" ")[-1] != '.']
+    has_value = time_series_df[value_columns].notna().any(axis=1)
+    has_value = (has_value & time_series_df['YEAR'].notna() &
+                 ~time_series_df['REPORTED FUEL TYPE CODE'].isin(["   "]))
+    return set(time_series_df.loc[has_value, 'PLANT ID'].dropna())
+
+def build_sensor_lookup(wide_df):
+    # Resolve each distinct (fuel, prime mover, MER, nuclear unit) combination
+    # to its sensor names once, rather than once per row. Returns the
+    # combination code of each row, plus a (combination x metric) table of
+    # sensor name codes into a sorted list of sensor names, the metric
+    # suffixes and the combinations themselves.
+    # Clean up Nuclear ID column, as that can delineate individual metrics
+    nuclear_unit_id = wide_df['NUCLEAR UNIT ID'].astype(object)
+    nuclear_unit_id = nuclear_unit_id.where(
+        ~((nuclear_unit_id == '.') | nuclear_unit_id.isna()), "").astype(str)
+    code_df = pd.DataFrame({
+        'fuel': wide_df['REPORTED FUEL TYPE CODE'],
+        'prime_mover': wide_df['REPORTED PRIME MOVER'],
+        'mer': wide_df['MER FUEL TYPE CODE'],
+        'nuclear_unit_id': nuclear_unit_id}).astype('category')
+    grouped = code_df.groupby(list(code_df.columns), sort=False,
+                              observed=True, dropna=False)
+    combo_codes = grouped.ngroup().to_numpy()
+    combo_df = grouped.size().index.to_frame(index=False).astype(object)
+    prefix = (combo_df['fuel'].map(lookups.get_lookup("energy_source")) + " - " +
+              combo_df['prime_mover'].map(lookups.get_lookup("prime_mover")) + " - " +
+              combo_df['mer'].map(lookups.get_lookup("mer_fuel")))
+    metric_suffixes = list(dict.fromkeys(sensor_suffix_dict.values()))
+    sensor_names = []
+    for suffix in metric_suffixes:
+        names = prefix + suffix
+        # ADD NUCLEAR UNIT ID IF NECESSARY
+        names = names.where(combo_df['nuclear_unit_id'] == "",
+                            names + " Unit " + combo_df['nuclear_unit_id'])
+        sensor_names.append(names.to_numpy())
+    # Table is laid out as combination * number of metrics + metric
+    sensor_names = np.stack(sensor_names, axis=1).ravel()
+    sensor_codes, sensor_categories = pd.factorize(sensor_names, sort=True)
+    return (combo_codes, sensor_codes, sensor_categories, metric_suffixes,
+            combo_df)
+
+def get_sensor_groups(wide_df):
+    # Fuel group (from the energy source code), MER fuel category and metric
+    # of each sensor name the rows of wide_df can produce. Sensor names
+    # include the prime mover and MER code, so each one has a single group.
+    _, sensor_codes, sensor_categories, metric_suffixes, combo_df = \
+        build_sensor_lookup(wide_df)
+    groups_df = pd.DataFrame({
+        'sensor_code': sensor_codes,
+        'fuel_group': np.repeat(lookups.get_fuel_groups(
+            combo_df['fuel'], combo_df['prime_mover'],
+            combo_df['mer']).to_numpy(), len(metric_suffixes)),
+        'fuel_category': np.repeat(combo_df['mer'].map(
+            lookups.get_lookup("mer_category")).to_numpy(), len(metric_suffixes)),
+        'metric': np.tile([x.replace(" - ", "", 1) for x in metric_suffixes],
+                          len(combo_df))})
+    groups_df = groups_df[groups_df['sensor_code'] != -1].drop_duplicates(
+        'sensor_code')
+    groups_df.index = sensor_categories[groups_df['sensor_code'].to_numpy()]
+    return groups_df[['fuel_group', 'fuel_category', 'metric']]
+
+def get_plant_regions(df):
+    # State and balancing authority of each plant, as first reported
+    regions_df = df[['PLANT ID', 'STATE', 'BALANCING AUTHORITY CODE']
+                    ].drop_duplicates('PLANT ID')
+    return pd.DataFrame({
+        'state': regions_df['STATE'].astype(object).to_numpy(),
+        'balancing_authority_code': regions_df[
+            'BALANCING AUTHORITY CODE'].astype(object).to_numpy()},
+        index=regions_df['PLANT ID'].to_numpy())
+
+def build_date_lookup(years, months):
+    # Parse each distinct (year, month) pair once. Returns the year code of
+    # each row, and a (year x month) table of dates.
+    year_codes, year_uniques = pd.factorize(years.astype(str),
+                                            use_na_sentinel=False)
+    date_strings = [month + " 1, " + year for year in year_uniques
+                    for month in months]
+    dates = pd.to_datetime(pd.Series(date_strings, dtype=object),
+                           errors='coerce').to_numpy()
+    return year_codes, dates
+
+def build_long_format_data(time_series_df, joiner_columns):
+    # Melt the full frame once and build the measured_on and sensor_name
+    # columns for every plant in one pass. Returns one row per plant,
+    # month and sensor, with duplicate readings averaged.
+    value_columns = [x for x in time_series_df.columns if x not in joiner_columns]
+    sensor_columns = [x for x in value_columns
+                      if get_sensor_suffix(x) is not None
+                      and x.split(" ")[-1] != '.']
+    wide_df = time_series_df[time_series_df['YEAR'].notna() &
+                             ~time_series_df['REPORTED FUEL TYPE CODE'].isin(["   "])]
+    # Month and metric come from the variable name, so look them up once
+    # per column rather than once per row
+    months = list(dict.fromkeys(x.split(" ")[-1] for x in sensor_columns))
+    month_lookup = np.array([months.index(x.split(" ")[-1])
+                             for x in sensor_columns], dtype='int64')
+    combo_codes, sensor_codes, sensor_categories, metric_suffixes, _ = \
+        build_sensor_lookup(wide_df)
+    metric_lookup = np.array([metric_suffixes.index(get_sensor_suffix(x))
+                              for x in sensor_columns], dtype='int64')
+    year_codes, dates = build_date_lookup(wide_df['YEAR'], months)
+    # Melt the values by column, keeping the row and column position of each
+    values = wide_df[sensor_columns].to_numpy(dtype='float64').ravel(order='F')
+    row_index = np.tile(np.arange(len(wide_df)), len(sensor_columns))
+    column_index = np.repeat(np.arange(len(sensor_columns)), len(wide_df))
+    # Remove missing values ("." in the workbooks)
+    keep = ~np.isnan(values)
+    values, row_index, column_index = (values[keep], row_index[keep],
+                                       column_index[keep])
+    row_sensor_codes = sensor_codes[combo_codes[row_index] *
+                                    len(metric_suffixes) +
+                                    metric_lookup[column_index]]
+    measured_on = dates[year_codes[row_index] * len(months) +
+                        month_lookup[column_index]]
+    keep = (row_sensor_codes != -1) & ~pd.isna(measured_on)
+    long_df = pd.DataFrame({
+        'PLANT ID': wide_df['PLANT ID'].array.take(row_index[keep]),
+        'measured_on': measured_on[keep],
+        'sensor_name': pd.Categorical.from_codes(row_sensor_codes[keep],
+                                                 sensor_categories),
+        'value': values[keep]})
+    long_df = long_df.drop_duplicates()
+    long_df = long_df.groupby(['PLANT ID', 'measured_on', 'sensor_name'],
+                              sort=False, observed=True)['value'].mean().reset_index()
+    return long_df
+
+def process_master_plant_data(df,
+                              joiner_columns,
+                              metadata_columns,
+                              removal_columns,
+                              data_type,
+                              plant_ids=None,
+                              output_format="csv",
+                              store_path=long_format_store.STORE_PATH,
+                              partition_by="year",
+                              profiler=None,
+                              rollups=None):
+    # plant_ids optionally limits the rebuild to a set of plant IDs (as
+    # strings). output_format is "csv" for a file per plant, "parquet" for the
+    # long format store or "both". profiler is an optional RunProfiler that
+    # each step is reported to, and rollups an optional FleetRollups that
+    # the long data is summed into. Returns the IDs of the plants written.
+    with profile_stage(profiler, "write_metadata", len(df)) as record:
+        meta_df = df[metadata_columns].drop_duplicates()
+        write_plant_metadata(meta_df, data_type)
+        record["rows_out"] = len(meta_df)
+    return process_plant_time_series(df, joiner_columns, metadata_columns,
+                                     removal_columns, plant_ids=plant_ids,
+                                     output_format=output_format,
+                                     store_path=store_path,
+                                     partition_by=partition_by,
+                                     replace_plants=plant_ids,
+                                     profiler=profiler, rollups=rollups)
+
+def write_plant_metadata(meta_df, data_type):
+    meta_df.to_csv("./923_metadata/" + data_type + "_923_metadata.csv", 
+                   index=False)
+
+def process_plant_time_series(df,
+                              joiner_columns,
+                              metadata_columns,
+                              removal_columns,
+                              plant_ids=None,
+                              output_format="csv",
+                              store_path=long_format_store.STORE_PATH,
+                              partition_by="year",
+                              replace_plants=None,
+                              profiler=None,
+                              rollups=None):
+    # Build and write the time series of every plant in df, as
+    # process_master_plant_data does after writing the metadata.
+    # replace_plants is passed on to write_long_format_store.
+    plants = list(df["PLANT ID"].dropna().drop_duplicates())
+    time_series_columns = list(Counter(list(df.columns)) - 
+                               Counter(metadata_columns) + 
+                               Counter(joiner_columns) - 
+                               Counter(removal_columns))
+    # Now remove all of the metadata columns with the exception of the joiner columns
+    time_series_df = df[time_series_columns]
+    if plant_ids is not None:
+        plants = [x for x in plants if str(x) in plant_ids]
+        time_series_df = time_series_df[
+            time_series_df['PLANT ID'].astype(str).isin(plant_ids)]
+    with profile_stage(profiler, "get_active_plants",
+                       len(time_series_df)) as record:
+        active_plants = get_active_plants(time_series_df, joiner_columns)
+        record["rows_out"] = len(active_plants)
+    with profile_stage(profiler, "build_long_format_data",
+                       len(time_series_df)) as record:
+        long_df = build_long_format_data(time_series_df, joiner_columns)
+        record["rows_out"] = len(long_df)
+    if rollups is not None:
+        with profile_stage(profiler, "build_fleet_cube",
+                           len(long_df)) as record:
+            rollups.add(long_df, get_plant_regions(df),
+                        get_sensor_groups(time_series_df))
+            record["rows_out"] = len(rollups.cubes)
+    if output_format in ("parquet", "both"):
+        with profile_stage(profiler, "write_long_format_store",
+                           len(long_df)) as record:
+            plant_states = df[['PLANT ID', 'STATE']].drop_duplicates('PLANT ID')
+            plant_states = dict(zip(plant_states['PLANT ID'].astype(str),
+                                    plant_states['STATE']))
+            store_df = long_format_store.build_store_frame(long_df, plant_states)
+            long_format_store.write_long_format_store(store_df,
+                                                      path=store_path,
+                                                      partition_by=partition_by,
+                                                      replace_plants=replace_plants)
+            record["rows_out"] = len(store_df)
+    written_plants = [str(x) for x in plants if x in active_plants]
+    if output_format in ("csv", "both"):
+        with profile_stage(profiler, "write_plant_csvs",
+                           len(long_df)) as record:
+            write_plant_csvs(long_df, plants, active_plants, profiler=profiler)
+            record["rows_out"] = len(written_plants)
+    return written_plants
+
+# Working memory of processing a chunk in streaming mode, relative to the
+# size of the chunk's frame: the time series copy, the melt arrays and the
+# long frame
+STREAM_MEMORY_FACTOR = 6
+# Rough peak memory of a worker parsing one workbook (the sheet read as
+# objects, plus the reader), used to cap the parse workers in streaming mode
+PARSE_WORKER_MB = 256
+
+
+def get_plant_bucket(plant_ids, buckets):
+    # Bucket number of each plant ID, given as numbers or strings. Missing
+    # and non-numeric IDs go to bucket 0.
+    numbers = pd.to_numeric(pd.Series(plant_ids, dtype=object),
+                            errors='coerce').fillna(0).astype('int64')
+    return (numbers % buckets).to_numpy()
+
+def spill_generation_frame(spill, generation_df, row_offset):
+    # Write a parsed workbook to the spill, numbering its rows from
+    # row_offset so that the rows of all workbooks can be put back in order.
+    # Returns the offset of the next workbook.
+    generation_df.index = pd.RangeIndex(row_offset,
+                                        row_offset + len(generation_df))
+    spill.add(generation_df, get_plant_bucket(generation_df['PLANT ID'],
+                                              spill.buckets))
+    return row_offset + len(generation_df)
+
+def process_master_plant_data_streaming(spill,
+                                        joiner_columns,
+                                        metadata_columns,
+                                        removal_columns,
+                                        data_type,
+                                        files_remove,
+                                        memory_budget,
+                                        plant_ids=None,
+                                        output_format="csv",
+                                        store_path=long_format_store.STORE_PATH,
+                                        partition_by="year",
+                                        profiler=None,
+                                        rollups=None):
+    # process_master_plant_data for data spilled to disk by plant bucket.
+    # Buckets are loaded a chunk at a time, sized to memory_budget (in
+    # bytes). Every plant's rows are in a single bucket, so each plant is
+    # built from all of its data at once and the output matches the
+    # in-memory path. files_remove are the files left out of the data.
+    if output_format in ("parquet", "both") and plant_ids is None:
+        # The store is rebuilt a chunk of plants at a time
+        long_format_store.clear_long_format_store(store_path)
+    meta_frames = []
+    written_plants = []
+    for chunk in spill.plan_chunks(memory_budget, STREAM_MEMORY_FACTOR):
+        with profile_stage(profiler, "load_chunk") as record:
+            chunk_accumulator = FrameAccumulator("generation chunk")
+            for piece in spill.read(chunk):
+                chunk_accumulator.add(piece)
+            chunk_df = chunk_accumulator.build()
+            chunk_df = chunk_df[~chunk_df['file'].isin(files_remove)]
+            record["rows_out"] = len(chunk_df)
+        # Rows that are duplicates have the same plant ID, so they are in
+        # the same chunk
+        meta_frames.append(chunk_df[metadata_columns].drop_duplicates())
+        if plant_ids is None:
+            replace_plants = set(chunk_df['PLANT ID'].dropna().astype(str))
+        else:
+            replace_plants = set(x for x in plant_ids if get_plant_bucket(
+                [x], spill.buckets)[0] in chunk)
+        written_plants += process_plant_time_series(
+            chunk_df, joiner_columns, metadata_columns, removal_columns,
+            plant_ids=plant_ids, output_format=output_format,
+            store_path=store_path, partition_by=partition_by,
+            replace_plants=replace_plants, profiler=profiler,
+            rollups=rollups)
+        del chunk_df
+    with profile_stage(profiler, "write_metadata") as record:
+        # Put the rows back in the order of the full data
+        meta_df = pd.concat(meta_frames, axis=0).sort_index(kind='stable')
+        write_plant_metadata(meta_df, data_type)
+        record["rows_out"] = len(meta_df)
+    return written_plants
+
+def write_plant_csvs(long_df, plants, active_plants,
+                     output_dir="./923_monthly_production/", profiler=None):
+    # Split the long data by plant in a single pass
+    plant_groups = dict(list(long_df.groupby('PLANT ID', sort=False)))
+    # Generate data for each plant
+    for plant_id in plants:
+        if plant_id not in active_plants:
+            continue
+        start = time.perf_counter()
+        plant_df = plant_groups.get(plant_id, long_df.iloc[0:0])
+        plant_df = plant_df.astype({'sensor_name': object})
+        # Pivot it
+        plant_df = plant_df.pivot(index='measured_on',
+                                  columns='sensor_name',
+                                  values='value')
+        # Write to a csv file
+        plant_df.to_csv(os.path.join(output_dir, str(plant_id) + ".csv"))
+        if profiler is not None:
+            profiler.record_plant(plant_id, time.perf_counter() - start)
+
+def build_run_manifest(df, file_hashes, plants_touched):
+    # Record what went into this run: the hash of each file used per year,
+    # the latest month loaded for each year and the plants under each year
+    years = pd.to_numeric(df['YEAR'], errors='coerce')
+    year_df = pd.DataFrame({'YEAR': years,
+                            'file': df['file'],
+                            'PLANT ID': df['PLANT ID'].astype(str)})
+    year_df = year_df[~year_df['YEAR'].isna()]
+    year_files = dict()
+    year_plants = dict()
+    max_month = dict()
+    for year, group in year_df.groupby('YEAR'):
+        year = str(int(year))
+        files = sorted(group['file'].drop_duplicates())
+        year_files[year] = {x: file_hashes.get(x) for x in files}
+        year_plants[year] = sorted(group['PLANT ID'].drop_duplicates())
+        months = []
+        for file in files:
+            match = re.search(rf'M_(\d+)_{year}', file)
+            if match:
+                months.append(int(match.group(1)))
+        max_month[year] = max(months) if len(months) > 0 else None
+    return {"version": GENERATION_CACHE_VERSION,
+            "run_at": datetime.datetime.now().isoformat(timespec='seconds'),
+            "year_files": year_files,
+            "max_month": max_month,
+            "plants_touched": sorted(plants_touched),
+            "year_plants": year_plants}
+
+def get_output_settings(output_format, store_path, partition_by):
+    # Outputs a run wrote, so an incremental run only updates outputs that
+    # were written the same way
+    if output_format == "csv":
+        store_path, partition_by = None, None
+    else:
+        store_path = os.path.normpath(store_path)
+    return {"output_format": output_format, "store_path": store_path,
+            "partition_by": partition_by}
+
+def load_run_manifest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def write_run_manifest(manifest, path):
+    with open(path, 'w') as file:
+        json.dump(manifest, file, indent=1)
+
+def get_changed_years(manifest, previous_manifest):
+    # Years whose source files changed since the last run. Returns None when
+    # everything has to be rebuilt.
+    if (previous_manifest is None or
+            previous_manifest.get("version") != manifest["version"]):
+        return None
+    years = set(manifest["year_files"]) | set(previous_manifest["year_files"])
+    return sorted(x for x in years if manifest["year_files"].get(x) !=
+                  previous_manifest["year_files"].get(x))
+
+def get_changed_plants(manifest, previous_manifest):
+    # Plants with data in any year whose source files changed since the last
+    # run. Returns None when everything has to be rebuilt.
+    changed_years = get_changed_years(manifest, previous_manifest)
+    if changed_years is None:
+        return None
+    plants = set()
+    for year in changed_years:
+        # Include last run's plants too, in case a plant dropped out of a year
+        plants.update(manifest["year_plants"].get(year, []))
+        plants.update(previous_manifest["year_plants"].get(year, []))
+    return plants
+
+def get_soup(URL):
+    import requests
+    from bs4 import BeautifulSoup as bs
+    return bs(requests.get(URL, verify=False).text, 'html.parser')
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, 
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        filename='app.log', 
+                        force=True,
+                        filemode='a')
+    parser = argparse.ArgumentParser(description="Build the EIA 923 monthly "
+                                     "production data for each plant.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of processes used to parse the 923 "
+                        "workbooks. Use 1 to parse them serially.")
+    parser.add_argument("--cache-dir", default=workbook_cache.CACHE_DIR,
+                        help="Directory for the cache of parsed workbooks.")
+    parser.add_argument("--cache-max-mb", type=int,
+                        default=workbook_cache.CACHE_MAX_BYTES // 1024 ** 2,
+                        help="Size limit of the workbook cache, in MB.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Parse every workbook without using the cache.")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="Empty the workbook cache before parsing.")
+    parser.add_argument("--output-format", default="csv",
+                        choices=["csv", "parquet", "both"],
+                        help="Write a CSV per plant, the long format Parquet "
+                        "store, or both.")
+    parser.add_argument("--store-path", default=long_format_store.STORE_PATH,
+                        help="Directory of the long format Parquet store.")
+    parser.add_argument("--partition-by", default="year",
+                        choices=long_format_store.PARTITION_COLUMNS,
+                        help="Partition column of the Parquet store.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only rewrite the plant files with data in years "
+                        "whose source files changed since the last run.")
+    parser.add_argument("--download", action="store_true",
+                        help="Update the local mirror of the 923 zip files "
+                        "and extract any that changed before processing.")
+    parser.add_argument("--mirror-dir", default="./923_mirror",
+                        help="Directory of the local mirror of the 923 files.")
+    parser.add_argument("--download-workers", type=int, default=4,
+                        help="Number of files downloaded at the same time.")
+    parser.add_argument("--summary-path",
+                        default="./923_metadata/generation_923_run_summary.json",
+                        help="File the JSON run summary is written to.")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Run under cProfile and dump the stats to PATH. "
+                        "The workbooks are parsed in the main process "
+                        "(--workers 1), so that the profile covers them.")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Track allocations with tracemalloc. Slows the "
+                        "run down noticeably.")
+    parser.add_argument("--top-n", type=int, default=10,
+                        help="Number of slowest plants and files listed in "
+                        "the run summary.")
+    parser.add_argument("--schedule-dir", default=sheet_router.SCHEDULE_DIR,
+                        help="Directory of the schedule tables routed from "
+                        "the other sheets of the 923 workbooks.")
+    parser.add_argument("--index-dir", default=metadata_index.INDEX_DIR,
+                        help="Directory of the lookup indexes built over the "
+                        "generation metadata.")
+    parser.add_argument("--rollup-dir", default=fleet_rollups.ROLLUP_DIR,
+                        help="Directory of the state, balancing authority, "
+                        "fuel group and national monthly totals.")
+    parser.add_argument("--memory-budget-mb", type=int,
+                        help="Process the plants in chunks that fit in this "
+                        "much memory, spilling the parsed workbooks and "
+                        "schedule tables to disk, instead of holding all of "
+                        "the data at once. The parse workers are capped to "
+                        "fit as well, at about " + str(PARSE_WORKER_MB) +
+                        " MB each.")
+    parser.add_argument("--spill-dir", default=bucket_spill.SPILL_DIR,
+                        help="Directory for the data spilled to disk by "
+                        "--memory-budget-mb.")
+    args = parser.parse_args(argv)
+    profiler = RunProfiler("generation", profile_path=args.profile,
+                           trace_memory=args.trace_memory, top_n=args.top_n)
+    cache_dir = None if args.no_cache else args.cache_dir
+    if args.clear_cache:
+        workbook_cache.clear_cache(args.cache_dir)
+    logger = logging.getLogger(__name__)
+    if args.download:
+        # Mirror the 923 zip files, and extract the ones that changed
+        with profiler.stage("download") as record:
+            links = eia_mirror.list_links(URL, ".zip")
+            results = eia_mirror.mirror_files([URL + x for x in links],
+                                              args.mirror_dir,
+                                              workers=args.download_workers)
+            for file_link in links:
+                path, status = results[URL + file_link]
+                extract_dir = "./923_extracts/" + file_link.replace(".zip", "")
+                if status is None:
+                    continue
+                if status != "not_modified" or not os.path.isdir(extract_dir):
+                    with zipfile.ZipFile(path) as z:
+                        z.extractall(extract_dir)
+            record["rows_out"] = len(links)
+            
+    # Glob glob the dataset
+    
+    files = (glob.glob(r"./923_extracts/*/*/*.xls*")
+             + glob.glob(r"./923_extracts/*/*/*/*.xls*"))
+    
+    generation_accumulator = FrameAccumulator("generation")
+    # One accumulator per routed schedule table, e.g. the Schedule 8
+    # environmental data and the nonutility source and disposition data
+    schedule_accumulators = dict()
+    schedule_spills = dict()
+    file_hashes = dict()
+    spill = None
+    workers = args.workers
+    try:
+        if args.memory_budget_mb is not None:
+            # Streaming mode: spill the data to disk, and only keep the columns
+            # needed to pick the files and build the run manifest in memory
+            spill = bucket_spill.BucketSpill(args.spill_dir)
+            row_offset = 0
+            workers = min(workers,
+                          max(1, args.memory_budget_mb // PARSE_WORKER_MB))
+            if workers < args.workers:
+                logger.info("Parsing with %s workers to fit the memory budget",
+                            workers)
+        if args.profile is not None and workers > 1:
+            # cProfile only sees the main process, so the workbooks are parsed
+            # there rather than in workers
+            workers = 1
+            logger.info("Parsing in the main process for --profile")
+    
+    
+        with profiler.stage("parse_workbooks", len(files)) as record:
+            for file, generation_df, tables, error, stats in read_workbooks(
+                    files, workers=workers, cache_dir=cache_dir):
+                print(file)
+                profiler.record_file(
+                    file, stats["seconds"], cached=stats["cached"],
+                    error=error,
+                    rows=None if generation_df is None else len(generation_df))
+                if error is not None:
+                    print("ERROR ENCOUNTERED: " + file)
+                    logger.error("Could not process %s: %s", file, error)
+                    continue
+                for table, table_df in tables.items():
+                    if spill is not None:
+                        # One bucket per table, written a workbook at a time
+                        if table not in schedule_spills:
+                            schedule_spills[table] = bucket_spill.BucketSpill(
+                                args.spill_dir, buckets=1)
+                        schedule_spills[table].add(
+                            table_df, np.zeros(len(table_df), dtype='int64'))
+                        continue
+                    if table not in schedule_accumulators:
+                        schedule_accumulators[table] = FrameAccumulator(table)
+                    schedule_accumulators[table].add(table_df)
+                if generation_df is not None:
+                    file_hashes[os.path.basename(
+                        file.replace("~$", ""))] = stats["sha256"]
+                    if spill is None:
+                        generation_accumulator.add(generation_df)
+                    else:
+                        generation_accumulator.add(generation_df[
+                            ['YEAR', 'file', 'PLANT ID']].drop_duplicates())
+                        row_offset = spill_generation_frame(
+                            spill, generation_df, row_offset)
+            master_generation_df = generation_accumulator.build()
+            record["rows_out"] = len(master_generation_df)
+        print(generation_accumulator.stats)
+        if cache_dir is not None:
+            workbook_cache.evict_cache(cache_dir,
+                                       args.cache_max_mb * 1024 ** 2)
+        with profiler.stage("filter_latest_year_data",
+                            len(master_generation_df)) as record:
+            files_remove = filter_latest_year_data(master_generation_df)
+            if len(files_remove) > 0:
+                master_generation_df = master_generation_df[
+                    ~master_generation_df['file'].isin(files_remove)]
+            record["rows_out"] = len(master_generation_df)
+        with profiler.stage("write_schedule_tables") as record:
+            record["rows_out"] = 0
+            # Only one table is held in memory at a time
+            for table in list(schedule_accumulators) + list(schedule_spills):
+                if table in schedule_spills:
+                    accumulator = FrameAccumulator(table)
+                    for piece in schedule_spills[table].read([0]):
+                        accumulator.add(piece)
+                    schedule_spills.pop(table).cleanup()
+                else:
+                    accumulator = schedule_accumulators.pop(table)
+                table_df = accumulator.build()
+                del accumulator
+                # Sheets of the early release workbooks superseded above
+                table_df = sheet_router.finish_table(
+                    table_df[~table_df['file'].isin(files_remove)])
+                sheet_router.write_table(table_df, table, args.output_format,
+                                         args.schedule_dir)
+                profiler.count(table + "_rows", len(table_df))
+                record["rows_out"] += len(table_df)
+        if len(master_generation_df) == 0:
+            # Only the schedule tables to write, so there's no manifest, plant
+            # data, rollups or index to build
+            print("No generation data found, only the schedule tables were "
+                  "written")
+            logger.warning("No generation data in %s workbooks, skipping the "
+                           "plant outputs", len(files))
+            profiler.count("files", len(files))
+            profiler.count("plants_touched", 0)
+            profiler.write_summary(args.summary_path)
+            return
+        # Now that we've got all of our data in standardized format, let's
+        # split by system, and build individual time series for each plant
+        manifest_path = "./923_metadata/generation_923_run_manifest.json"
+        with profiler.stage("build_run_manifest", len(master_generation_df)):
+            manifest = build_run_manifest(master_generation_df, file_hashes,
+                                          [])
+            manifest["outputs"] = get_output_settings(
+                args.output_format, args.store_path, args.partition_by)
+        plant_ids = None
+        changed_years = None
+        if args.incremental:
+            previous_manifest = load_run_manifest(manifest_path)
+            plant_ids = get_changed_plants(manifest, previous_manifest)
+            changed_years = get_changed_years(manifest, previous_manifest)
+            if plant_ids is not None and not fleet_rollups.has_rollups(
+                    args.rollup_dir):
+                # The rollups of the unchanged years can't be updated in place
+                plant_ids = None
+                logger.info("No fleet rollups written yet, rebuilding every "
+                            "plant")
+            elif (plant_ids is not None and
+                  previous_manifest.get("outputs") != manifest["outputs"]):
+                # e.g. the last run wrote only CSVs, or partitioned the store
+                # differently, so the outputs can't be updated in place
+                plant_ids = None
+                logger.warning("Output settings changed since the last run, "
+                               "rebuilding every plant")
+            elif (plant_ids is not None and args.output_format != "csv" and
+                  not long_format_store.has_store(args.store_path,
+                                                  args.partition_by)):
+                plant_ids = None
+                logger.warning("No long format store at %s, rebuilding every "
+                               "plant", args.store_path)
+            elif plant_ids is None:
+                logger.info("No usable run manifest, rebuilding every plant")
+            else:
+                logger.info("Rebuilding %s changed plants", len(plant_ids))
+        rollups = fleet_rollups.FleetRollups()
+        if spill is None:
+            plants_touched = process_master_plant_data(
+                df = master_generation_df,
+                joiner_columns = joiner_columns,
+                metadata_columns = generation_metadata_columns,
+                removal_columns = removal_columns,
+                data_type = "generation",
+                plant_ids = plant_ids,
+                output_format = args.output_format,
+                store_path = args.store_path,
+                partition_by = args.partition_by,
+                profiler = profiler,
+                rollups = rollups)
+        else:
+            plants_touched = process_master_plant_data_streaming(
+                spill = spill,
+                joiner_columns = joiner_columns,
+                metadata_columns = generation_metadata_columns,
+                removal_columns = removal_columns,
+                data_type = "generation",
+                files_remove = files_remove,
+                memory_budget = args.memory_budget_mb * 1024 ** 2,
+                plant_ids = plant_ids,
+                output_format = args.output_format,
+                store_path = args.store_path,
+                partition_by = args.partition_by,
+                profiler = profiler,
+                rollups = rollups)
+        with profiler.stage("write_fleet_rollups") as record:
+            # Plants of the changed years are all rebuilt, so those years can
+            # be summed from this run alone
+            cube_df = rollups.write(args.rollup_dir, replace_years=(
+                None if plant_ids is None else changed_years))
+            record["rows_out"] = len(cube_df)
+        with profiler.stage("build_index"):
+            metadata_index.build_index("generation_923",
+                                       index_dir=args.index_dir)
+        manifest["plants_touched"] = sorted(plants_touched)
+        write_run_manifest(manifest, manifest_path)
+        profiler.count("files", len(files))
+        profiler.count("plants_touched", len(plants_touched))
+        profiler.write_summary(args.summary_path)
+    finally:
+        # Also when the run fails part way, so no copies of the parsed
+        # workbooks are left in the spill directory
+        if spill is not None:
+            spill.cleanup()
+        for table_spill in schedule_spills.values():
+            table_spill.cleanup()
+
+
+if __name__ == "__main__":
+    main()
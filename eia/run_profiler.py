@@ -0,0 +1,165 @@
+"""
+Instrumentation for the pipeline scripts. Each stage of a run is timed and
+logged with its row counts and memory use, along with the parse time of
+every workbook and sheet and the slowest plants. cProfile and tracemalloc
+can be switched on for a run, and everything ends up in a JSON run summary.
+"""
+
+import cProfile
+import datetime
+import heapq
+import io
+import json
+import logging
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from .frame_accumulator import get_peak_rss_mb
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_VERSION = 1
+
+
+def get_rss_mb():
+    # Current resident memory of this process in MB, or None if unknown
+    try:
+        with open("/proc/self/statm", 'r') as file:
+            pages = int(file.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2, 1)
+
+def _subtract(after, before):
+    if after is None or before is None:
+        return None
+    return round(after - before, 1)
+
+
+class RunProfiler:
+    # Collects the instrumentation of one run. profile_path turns on cProfile
+    # (stats are dumped there), trace_memory turns on tracemalloc, and top_n
+    # is the number of slowest plants and files kept in the summary.
+
+    def __init__(self, name, profile_path=None, trace_memory=False, top_n=10):
+        self.name = name
+        self.profile_path = profile_path
+        self.trace_memory = trace_memory
+        self.top_n = top_n
+        self.stages = []
+        self.files = []
+        self.plant_count = 0
+        self.plant_seconds = 0.0
+        # Min heap of (seconds, plant ID), holding the top_n slowest plants
+        self.slowest_plants = []
+        self.counters = dict()
+        self.start_time = time.perf_counter()
+        self.started_at = datetime.datetime.now().isoformat(timespec="seconds")
+        self.profiler = None
+        if trace_memory:
+            tracemalloc.start()
+        if profile_path is not None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def _get_memory_mb(self):
+        if self.trace_memory:
+            return round(tracemalloc.get_traced_memory()[0] / 1024 ** 2, 1)
+        return get_rss_mb()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        # Time the body of the with block. The block can set "rows_out" on
+        # the yielded record.
+        record = {"stage": name, "rows_in": rows_in, "rows_out": None}
+        memory_before = self._get_memory_mb()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 3)
+            record["memory_delta_mb"] = _subtract(self._get_memory_mb(),
+                                                  memory_before)
+            record["peak_rss_mb"] = get_peak_rss_mb()
+            self.stages.append(record)
+            logger.info("Stage %s", json.dumps(record, default=str))
+
+    def record_file(self, file, seconds, rows=None, sheet=None, cached=None,
+                    error=None):
+        record = {"file": file, "sheet": sheet, "seconds": round(seconds, 3),
+                  "rows": rows, "cached": cached, "error": error}
+        self.files.append(record)
+        logger.info("File %s", json.dumps(record, default=str))
+
+    def record_plant(self, plant_id, seconds):
+        self.plant_count += 1
+        self.plant_seconds += seconds
+        item = (seconds, str(plant_id))
+        if len(self.slowest_plants) < self.top_n:
+            heapq.heappush(self.slowest_plants, item)
+        elif item > self.slowest_plants[0]:
+            heapq.heapreplace(self.slowest_plants, item)
+
+    def count(self, name, value):
+        self.counters[name] = value
+
+    def finish(self):
+        # Stop profiling and build the run summary
+        summary = {
+            "version": SUMMARY_VERSION,
+            "name": self.name,
+            "started_at": self.started_at,
+            "seconds": round(time.perf_counter() - self.start_time, 3),
+            "peak_rss_mb": get_peak_rss_mb(),
+            "stages": self.stages,
+            "files": self.files,
+            "slowest_files": sorted(self.files, key=lambda x: x["seconds"],
+                                    reverse=True)[:self.top_n],
+            "plants": {
+                "count": self.plant_count,
+                "seconds": round(self.plant_seconds, 3),
+                "slowest": [{"plant_id": x[1], "seconds": round(x[0], 4)}
+                            for x in sorted(self.slowest_plants, reverse=True)]},
+            "counters": self.counters}
+        # Snapshot before the profiler stats are formatted, so they don't
+        # show up in the allocations
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            summary["traced_peak_mb"] = round(
+                tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+            summary["top_allocations"] = [
+                {"location": str(x.traceback), "size_mb":
+                 round(x.size / 1024 ** 2, 2), "count": x.count}
+                for x in snapshot.statistics("lineno")[:self.top_n]]
+            tracemalloc.stop()
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path)
+            import pstats
+            stream = io.StringIO()
+            pstats.Stats(self.profiler, stream=stream).sort_stats(
+                "cumulative").print_stats(25)
+            logger.info("cProfile, top functions by cumulative time:\n%s",
+                        stream.getvalue())
+            summary["profile_path"] = self.profile_path
+        logger.info("Run summary %s: %s seconds, peak RSS %s MB",
+                    self.name, summary["seconds"], summary["peak_rss_mb"])
+        return summary
+
+    def write_summary(self, path):
+        summary = self.finish()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(summary, file, indent=1, default=str)
+        return summary
+
+
+@contextmanager
+def profile_stage(profiler, name, rows_in=None):
+    # profiler.stage, for code that may be run without a profiler
+    if profiler is None:
+        yield dict()
+        return
+    with profiler.stage(name, rows_in) as record:
+        yield record
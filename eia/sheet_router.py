@@ -0,0 +1,224 @@
+"""
+Route the sheets of the EIA-923 workbooks to typed tables. The sheet names of
+a workbook are read from its index without loading any sheet, so workbooks
+with nothing to extract are skipped cheaply. Each routed sheet has its header
+row found and normalized, and its columns cast to compact types, in the same
+way as the generation sheet.
+"""
+
+import logging
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from ._lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_DIR = "./923_schedules"
+# Bump this whenever parse_routed_sheet changes its output, so tables cached
+# by older code are parsed again
+SCHEDULE_CACHE_VERSION = 2
+# Table name, and the lowercase pieces of the sheet names routed to it. A
+# sheet goes to the first route it matches, and only the first matching sheet
+# of a workbook is read for each table. A workbook with no matching sheet is
+# routed by its file name instead (e.g. the 2008 nonutility source and
+# disposition workbook, whose sheets are Sheet1-Sheet3).
+SHEET_ROUTES = [
+    ("environmental_byproduct", ["byproduct disposition",
+                                 "by product disposition"]),
+    ("environmental_financial", ["financial information",
+                                 "byproduct expenses"]),
+    ("environmental_emissions_control", ["air emissions control"]),
+    ("environmental_fgd", ["fgd operation"]),
+    ("environmental_cooling", ["cooling"]),
+    ("source_disposition", ["source and disposition",
+                            "source_and_disposition", "schedule 6",
+                            "f906nonutil"]),
+    ("energy_storage", ["energy storage"])]
+# Headers that mark the header row of a routed sheet, after normalization.
+# They are all renamed to PLANT ID, so the tables share a key.
+PLANT_ID_HEADERS = ["PLANT ID", "PLANT CODE", "FACILITYID"]
+HEADER_SCAN_ROWS = 20
+# Units some years put in the headers (e.g. the 2013-2014 files), dropped so
+# a field keeps one column name across years
+UNIT_SUFFIX = re.compile(r"\s*\((THOUSAND|MILLION|GALLONS|MEGAWATTHOURS|LBS|"
+                         r"ºF)[^)]*\)$")
+# Column mappings of each routed table, for headers that were renamed over
+# the years. Applied after the units are dropped.
+SCHEDULE_COLUMN_MAPPINGS = {
+    "source_disposition": {"PPLANT STATE": "PLANT STATE",
+                           "STATE": "PLANT STATE",
+                           "FACILSTATE": "PLANT STATE",
+                           "FACILNAME": "PLANT NAME",
+                           "OWNERNAME": "UTILITY NAME",
+                           "OPERATOR NAME": "UTILITY NAME",
+                           "TOTAL SOURCES": "TOTAL SOURCE",
+                           "OTHER INCOMING ELECTRICITY": "INCOMING ELECTRICITY",
+                           "OTHER OUTGOING ELECTRICITY": "OUTGOING ELECTRICITY",
+                           "JUNCOMSUMP": "JUNCONSUMP"},
+    "environmental_fgd": {"FGD ID": "FGD UNIT ID",
+                          "FEED MATERIAL CHEMICALS":
+                              "FGD FEED MATERIALS AND CHEMICALS COSTS",
+                          "LABOR AND SUPERVISION":
+                              "FGD LABOR AND SUPERVISION COSTS",
+                          "MAINTENANCE MATERIAL OTHER":
+                              "FGD MAINTENANCE MATERIAL AND OTHER COSTS",
+                          "WASTE DISPOSAL": "FGD WASTE DISPOSAL COSTS",
+                          "TOTAL": "TOTAL O AND M"}}
+SCHEDULE_INT_COLUMNS = ['YEAR', 'MONTH', 'PLANT ID', 'UTILITY ID',
+                        'OPERATOR ID', 'SECTOR CODE', 'EIA SECTOR NUMBER',
+                        'NAICS CODE']
+SPREADSHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+def list_sheet_names(file):
+    # Sheet names of a workbook, read from the workbook index (xl/workbook.xml
+    # for xlsx and xlsm, the BOUNDSHEET records for xls) without parsing any
+    # of the sheets. Falls back to opening the workbook if the index can't
+    # be read, e.g. for a workbook saved under the wrong extension.
+    try:
+        if file.lower().endswith((".xlsx", ".xlsm")):
+            with zipfile.ZipFile(file) as z:
+                root = ET.fromstring(z.read("xl/workbook.xml"))
+            return [x.get("name") for x in root.iter(SPREADSHEET_NS + "sheet")]
+        import xlrd
+        book = xlrd.open_workbook(file, on_demand=True)
+        try:
+            return book.sheet_names()
+        finally:
+            book.release_resources()
+    except Exception:
+        with pd.ExcelFile(file) as excel_file:
+            return excel_file.sheet_names
+
+def route_sheets(sheet_names, file=None):
+    # Map each table to the sheets of the workbook that may hold it, in the
+    # order they are tried. When no sheet name matches, the tables matching
+    # the name of file are routed to every sheet, and the first one with a
+    # plant ID header is read.
+    routes = dict()
+    for sheet_name in sheet_names:
+        name = sheet_name.lower()
+        for table, patterns in SHEET_ROUTES:
+            if any(x in name for x in patterns):
+                routes.setdefault(table, [sheet_name])
+                break
+    if len(routes) == 0 and file is not None:
+        name = os.path.basename(file).lower()
+        for table, patterns in SHEET_ROUTES:
+            if any(x in name for x in patterns):
+                logger.info("No sheet of %s is named for %s, routing it by "
+                            "its file name", file, table)
+                routes[table] = list(sheet_names)
+                break
+    return routes
+
+def normalize_header(name):
+    name = re.sub(r"[\s_]+", " ", str(name)).strip().upper()
+    if name in PLANT_ID_HEADERS:
+        return "PLANT ID"
+    return name
+
+def map_header(name, table):
+    # Column of a routed table that a normalized header lands in
+    name = UNIT_SUFFIX.sub("", name.replace("O&M", "O AND M"))
+    return SCHEDULE_COLUMN_MAPPINGS.get(table, dict()).get(name, name)
+
+def find_header_row(raw_df):
+    for row in range(min(HEADER_SCAN_ROWS, len(raw_df))):
+        if any(normalize_header(x) in PLANT_ID_HEADERS
+               for x in raw_df.iloc[row] if isinstance(x, str)):
+            return row
+    return None
+
+def to_nullable_int(values):
+    # Whole numbers as a nullable integer column, with "." and any other
+    # text as NA. Columns holding fractions are kept as floats.
+    numbers = pd.to_numeric(values, errors='coerce')
+    if (np.nan_to_num(numbers) % 1 == 0).all():
+        return pd.array(numbers, dtype='Int64')
+    return numbers.astype('float64')
+
+def to_category(values):
+    # Store the values as strings, which is how they are written out, so
+    # the same code read as 1 in one file and "1" in another is one category
+    present = ~pd.isna(values)
+    return pd.Categorical(np.where(present, values.astype(str), None))
+
+def _is_code_column(column):
+    # IDs and codes stay text even when a file only holds numbers in them
+    return column.endswith((" ID", " CODE", " CONTROL"))
+
+def _to_typed(column, values):
+    if column in SCHEDULE_INT_COLUMNS:
+        return to_nullable_int(values)
+    if not _is_code_column(column):
+        # Numbers, if everything other than the "." sentinel and blanks is
+        # numeric
+        numbers = pd.to_numeric(values, errors='coerce')
+        text = pd.Series(values).astype(str).str.strip()
+        blank = pd.isna(values) | text.isin([".", ""]).to_numpy()
+        if (~np.isnan(numbers) | blank).all():
+            return numbers.astype('float64')
+    return to_category(values)
+
+def parse_routed_sheet(raw_df, file, table):
+    # Typed table from a raw routed sheet, read without a header. Returns
+    # None if the sheet has no plant ID header.
+    header_row = find_header_row(raw_df)
+    if header_row is None:
+        return None
+    header = [map_header(normalize_header(x), table) if not pd.isna(x)
+              else None for x in raw_df.iloc[header_row]]
+    usecols = [i for i, x in enumerate(header)
+               if x and x not in header[:i]]
+    table_df = raw_df.iloc[header_row + 1:, usecols]
+    table_df = table_df.dropna(how='all')
+    columns = dict()
+    for position, column in zip(usecols, table_df.columns):
+        columns[header[position]] = _to_typed(
+            header[position], table_df[column].to_numpy(dtype=object))
+    columns['file'] = to_category(np.full(len(table_df), file, dtype=object))
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(table_df)))
+
+def parse_routed_sheets(excel_file, routes, file):
+    # Parse the routed sheets of an open workbook. Returns a dict of table
+    # name to typed frame, from the first sheet of each route with a header
+    # row.
+    tables = dict()
+    for table, sheet_names in routes.items():
+        for sheet_name in sheet_names:
+            raw_df = excel_file.parse(sheet_name, header=None, dtype=object)
+            table_df = parse_routed_sheet(raw_df, file, table)
+            if table_df is not None:
+                tables[table] = table_df
+                break
+        else:
+            logger.warning("No header row found in sheets %s of %s, skipping "
+                           "them for %s", ", ".join(sheet_names), file, table)
+    return tables
+
+def finish_table(table_df):
+    # Columns typed differently across files (numbers in one, text in
+    # another) come out of the concatenation as objects; store them as text.
+    # Categories left without rows by filtering are dropped.
+    table_df = table_df.reset_index(drop=True)
+    for column in table_df.columns:
+        if table_df[column].dtype == object:
+            table_df[column] = to_category(table_df[column].to_numpy())
+        elif isinstance(table_df[column].dtype, pd.CategoricalDtype):
+            table_df[column] = table_df[column].cat.remove_unused_categories()
+    return table_df
+
+def write_table(table_df, table, output_format="csv", schedule_dir=SCHEDULE_DIR):
+    # CSV for reading anywhere, Parquet to keep the column types
+    os.makedirs(schedule_dir, exist_ok=True)
+    path = os.path.join(schedule_dir, table)
+    if output_format in ("csv", "both"):
+        table_df.to_csv(path + ".csv", index=False)
+    if output_format in ("parquet", "both"):
+        table_df.to_parquet(path + ".parquet", index=False)
@@ -0,0 +1,137 @@
+"""
+Local cache of parsed workbook data. Entries are keyed by the content hash
+of the workbook plus a version of the logic used to normalize it, so a
+workbook is only re-parsed when its contents or the parsing code change.
+"""
+
+import hashlib
+import logging
+import os
+from ._lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = "./.cache/workbooks"
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+# Frames of these namespaces are stored as Parquet, which round trips their
+# nullable integer, categorical and float columns and the row index, and
+# runs no code when read. Parquet needs pyarrow; without it these frames
+# aren't cached.
+PARQUET_NAMESPACES = ["generation"]
+# The other namespaces hold dicts of frames, such as the schedule tables of a
+# workbook, which Parquet can't store, so they are pickled. Reading a pickle
+# can run arbitrary code, so only point --cache-dir at a directory you trust.
+CACHE_EXTENSIONS = (".parquet", ".pkl")
+
+
+def hash_file(file, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_cache_path(file, namespace, version, cache_dir=CACHE_DIR,
+                   file_hash=None):
+    # The file name is part of the key, as it gets written into the frame.
+    # Pass file_hash when the hash of the file is already known, so the file
+    # isn't read again.
+    if file_hash is None:
+        file_hash = hash_file(file)
+    key = hashlib.sha256((file_hash + os.path.basename(file)
+                          ).encode("utf-8")).hexdigest()
+    extension = ".parquet" if namespace in PARQUET_NAMESPACES else ".pkl"
+    return os.path.join(cache_dir, namespace + "-v" + str(version) + "-" +
+                        key + extension)
+
+def _read_parquet(path):
+    # Categoricals holding no values come back from Parquet as objects, so
+    # they are restored from the pandas metadata written with the frame
+    import pyarrow.parquet as pq
+    df = pd.read_parquet(path)
+    for column in pq.read_schema(path).pandas_metadata["columns"]:
+        name = column["name"]
+        if (column["pandas_type"] == "categorical" and name in df.columns
+                and not isinstance(df[name].dtype, pd.CategoricalDtype)):
+            df[name] = pd.Categorical(df[name].to_numpy(dtype=object))
+    return df
+
+def read_cached_frame(file, namespace, version, cache_dir=CACHE_DIR,
+                      file_hash=None):
+    # Returns (hit, frame). A hit can hold None, for workbooks that were
+    # parsed but had nothing to extract.
+    path = get_cache_path(file, namespace, version, cache_dir, file_hash)
+    if not os.path.exists(path):
+        return False, None
+    try:
+        if path.endswith(".parquet"):
+            df = _read_parquet(path)
+        else:
+            df = pd.read_pickle(path)
+    except Exception as e:
+        logger.warning("Dropping unreadable cache entry %s: %s", path, e)
+        os.remove(path)
+        return False, None
+    # Mark the entry as recently used for eviction
+    os.utime(path)
+    return True, df
+
+def write_cached_frame(file, df, namespace, version, cache_dir=CACHE_DIR,
+                       file_hash=None):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = get_cache_path(file, namespace, version, cache_dir, file_hash)
+    # Write to a temporary file first, so parallel workers never see a
+    # partially written entry
+    temp_path = path + "." + str(os.getpid()) + ".tmp"
+    if path.endswith(".parquet"):
+        try:
+            df.to_parquet(temp_path)
+        except ImportError as e:
+            logger.warning("Not caching %s: %s", file, e)
+            return None
+    else:
+        pd.to_pickle(df, temp_path)
+    os.replace(temp_path, path)
+    return path
+
+def evict_cache(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    # Remove the least recently used entries until the cache fits in max_bytes
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = [os.path.join(cache_dir, x) for x in os.listdir(cache_dir)
+               if x.endswith(CACHE_EXTENSIONS)]
+    entries = sorted(entries, key=os.path.getmtime)
+    total_bytes = sum(os.path.getsize(x) for x in entries)
+    removed = []
+    for path in entries:
+        if total_bytes <= max_bytes:
+            break
+        total_bytes -= os.path.getsize(path)
+        os.remove(path)
+        removed.append(path)
+    if removed:
+        logger.info("Evicted %s cache entries from %s", len(removed), cache_dir)
+    return removed
+
+def invalidate_cached_frame(file, namespace, version, cache_dir=CACHE_DIR,
+                            file_hash=None):
+    path = get_cache_path(file, namespace, version, cache_dir, file_hash)
+    if os.path.exists(path):
+        os.remove(path)
+        return True
+    return False
+
+def clear_cache(cache_dir=CACHE_DIR, namespace=None):
+    # Remove every entry, or only the entries for one namespace
+    if not os.path.isdir(cache_dir):
+        return 0
+    removed = 0
+    for name in os.listdir(cache_dir):
+        if namespace is not None and not name.startswith(namespace + "-v"):
+            continue
+        os.remove(os.path.join(cache_dir, name))
+        removed += 1
+    logger.info("Cleared %s cache entries from %s", removed, cache_dir)
+    return removed